@@ -0,0 +1,175 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from typing import Any, Callable, Optional
+
+from blocking_io import run_blocking
+from cache import TTLCache
+
+try:
+    import jwt
+except ImportError:  # PyJWT is optional; without it every cold token goes to Supabase Auth
+    jwt = None
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Longest time a revoked token can keep being accepted from cache
+AUTH_MAX_STALENESS_SECONDS = float(os.getenv("AUTH_MAX_STALENESS_SECONDS", "60"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+SUPABASE_JWKS_URL = os.getenv("SUPABASE_JWKS_URL")
+JWT_AUDIENCE = "authenticated"
+# Supabase Auth answers that mean the token itself was refused
+AUTH_REJECTION_STATUSES = (401, 403)
+
+
+class AuthenticatedUser:
+    """Caller identity recovered from verified token claims"""
+
+    __slots__ = ("id", "email")
+
+    def __init__(self, id: str, email: Optional[str] = None):
+        self.id = id
+        self.email = email
+
+
+class InvalidToken(Exception):
+    """Raised when a token fails verification"""
+
+
+class AuthUnavailable(Exception):
+    """Raised when Supabase Auth couldn't be asked, so the token is neither accepted nor rejected"""
+
+
+def _is_rejection(error: Exception) -> bool:
+    """Whether an error from Supabase Auth is an explicit refusal rather than a transport failure"""
+    status = getattr(error, "status", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status in AUTH_REJECTION_STATUSES
+
+
+class TokenVerifier:
+    """Verifies bearer tokens with a bounded TTL/LRU cache in front of Supabase Auth.
+
+    With a JWT secret or JWKS URL configured, cold tokens are checked locally
+    (signature and expiry) and accepted immediately while Supabase Auth
+    confirms them in the background, so revoked tokens are rejected within
+    max_staleness. Without one, cold tokens are resolved through Supabase
+    Auth inline. Warm tokens never leave the process. Tokens Supabase Auth
+    refuses stay refused until they expire.
+    """
+
+    def __init__(
+        self,
+        fetch_remote: Callable[[str], Any],
+        jwt_secret: Optional[str] = SUPABASE_JWT_SECRET,
+        jwks_url: Optional[str] = SUPABASE_JWKS_URL,
+        max_staleness: float = AUTH_MAX_STALENESS_SECONDS,
+        maxsize: int = AUTH_CACHE_SIZE,
+    ):
+        self.fetch_remote = fetch_remote
+        self.jwt_secret = jwt_secret
+        self.max_staleness = max_staleness
+        self.users = TTLCache(maxsize=maxsize, ttl=max_staleness)
+        self.rejected = TTLCache(maxsize=maxsize, ttl=max_staleness)
+        self._jwks_client = None
+        if jwt is None and (jwt_secret or jwks_url):
+            logger.warning("PyJWT is not installed; local token verification disabled")
+        elif jwt is not None and jwks_url and not jwt_secret:
+            self._jwks_client = jwt.PyJWKClient(jwks_url, cache_keys=True)
+        self._background = set()
+
+    @property
+    def verifies_locally(self) -> bool:
+        return jwt is not None and bool(self.jwt_secret or self._jwks_client)
+
+    def _decode(self, token: str) -> dict:
+        """Validate signature and expiry locally and return the claims"""
+        try:
+            if self.jwt_secret:
+                return jwt.decode(token, self.jwt_secret, algorithms=["HS256"], audience=JWT_AUDIENCE)
+            signing_key = self._jwks_client.get_signing_key_from_jwt(token)
+            return jwt.decode(
+                token, signing_key.key,
+                algorithms=["RS256", "ES256"], audience=JWT_AUDIENCE
+            )
+        except jwt.PyJWTError as e:
+            raise InvalidToken(str(e))
+
+    def _ttl_for(self, exp: Optional[float]) -> float:
+        """Cache lifetime bounded by both max staleness and token expiry"""
+        if exp is None:
+            return self.max_staleness
+        return max(min(self.max_staleness, exp - time.time()), 0)
+
+    def _rejection_ttl(self, exp: Optional[float]) -> float:
+        """Rejections last until the token expires; max staleness when its expiry can't be read"""
+        if not isinstance(exp, (int, float)):
+            return self.max_staleness
+        return max(exp - time.time(), 0)
+
+    def _unverified_exp(self, token: str) -> Optional[float]:
+        if jwt is None:
+            return None
+        try:
+            return jwt.decode(token, options={"verify_signature": False}).get("exp")
+        except jwt.PyJWTError:
+            return None
+
+    def _resolve_remote(self, token: str, key: str) -> Any:
+        """Resolve a token through Supabase Auth and cache the outcome"""
+        try:
+            response = self.fetch_remote(token)
+        except Exception as e:
+            if not _is_rejection(e):
+                # Timeouts, resets and 5xx say nothing about the token; don't cache them
+                logger.warning(f"Supabase Auth unavailable: {e}")
+                raise AuthUnavailable(str(e)) from e
+            logger.info(f"Supabase Auth rejected token: {e}")
+            response = None
+        user = response.user if response else None
+        if not user:
+            self.users.pop(key)
+            self.rejected.set(key, True, ttl=self._rejection_ttl(self._unverified_exp(token)))
+            raise InvalidToken("Token rejected by Supabase Auth")
+        self.users.set(key, user, ttl=self._ttl_for(self._unverified_exp(token)))
+        return user
+
+    def _revalidate_in_background(self, token: str, key: str) -> None:
+        async def revalidate():
+            try:
+                await run_blocking(self._resolve_remote, token, key)
+            except InvalidToken:
+                logger.warning("Cached token was revoked")
+            except AuthUnavailable:
+                # Keep the locally verified entry; it's rechecked on its next cold lookup
+                pass
+
+        task = asyncio.get_running_loop().create_task(revalidate())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def authenticate(self, token: str) -> Any:
+        """Return the user for a token or raise InvalidToken"""
+        key = hashlib.sha256(token.encode()).hexdigest()
+        user = self.users.get(key)
+        if user is not None:
+            return user
+        if self.rejected.get(key, count=False):
+            raise InvalidToken("Token previously rejected")
+
+        if not self.verifies_locally:
+            return await run_blocking(self._resolve_remote, token, key)
+
+        claims = self._decode(token)
+        if not claims.get("sub"):
+            raise InvalidToken("Token has no subject")
+        user = AuthenticatedUser(claims["sub"], claims.get("email"))
+        self.users.set(key, user, ttl=self._ttl_for(claims.get("exp")))
+        self._revalidate_in_background(token, key)
+        return user
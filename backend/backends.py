@@ -0,0 +1,513 @@
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from supabase import create_client, Client
+
+from distance import bounding_box
+from records import PROFILE_COLUMNS, REQUEST_COLUMNS
+from user_stats import REQUEST_STATUS_FIELDS
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SQLITE_DATABASE_PATH = os.getenv("SQLITE_DATABASE_PATH", "payswap.sqlite3")
+SUPABASE_PAGE_SIZE = 1000
+# Optional Postgres function doing the radius search server-side; called with
+# lat, lon, radius_km, exclude_user_id and since
+SUPABASE_NEARBY_RPC = os.getenv("SUPABASE_NEARBY_RPC")
+# Optional Postgres function applying a batch of positions in one statement;
+# called with updates (a list of id, latitude, longitude, updated_at rows), e.g.
+#   UPDATE profiles p SET latitude = u.latitude, longitude = u.longitude, updated_at = u.updated_at
+#   FROM jsonb_to_recordset(updates) AS u(id uuid, latitude float8, longitude float8, updated_at timestamptz)
+#   WHERE p.id = u.id
+# Without it each position is written with its own UPDATE
+LOCATION_UPDATE_RPC = os.getenv("LOCATION_UPDATE_RPC")
+
+# Column each table's rows are tied to a user by, for bulk deletion
+USER_SCOPES = {
+    "requests": ("user_id",),
+    "transactions": ("from_user", "to_user"),
+    "profiles": ("id",),
+}
+
+
+def apply_bounding_box(query, lat: float, lon: float, radius_km: float):
+    """Restrict a requests query to the lat/lon box enclosing the search circle"""
+    min_lat, max_lat, lon_ranges = bounding_box(lat, lon, radius_km)
+    query = query.gte("latitude", min_lat).lte("latitude", max_lat)
+    if len(lon_ranges) == 1:
+        query = query.gte("longitude", lon_ranges[0][0]).lte("longitude", lon_ranges[0][1])
+    elif len(lon_ranges) == 2:
+        # Box crosses the antimeridian: east part starts at the first range, west part ends at the second
+        query = query.or_(f"longitude.gte.{lon_ranges[0][0]},longitude.lte.{lon_ranges[1][1]}")
+    return query
+
+
+class Storage(ABC):
+    """Blocking storage primitives behind Database.
+
+    Implementations only move rows in and out; caching, stats and error
+    handling live in Database, which runs these calls on the I/O pool.
+    """
+
+    # Label for the backend in upstream timing metrics
+    name = "storage"
+
+    @abstractmethod
+    def get_profile(self, user_id: str) -> Optional[Dict[str, Any]]: ...
+
+    @abstractmethod
+    def update_profile(self, user_id: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]: ...
+
+    def update_locations(self, rows: List[Dict[str, Any]]) -> None:
+        """Write id/latitude/longitude/updated_at rows to existing profiles; unknown ids are skipped"""
+        for row in rows:
+            self.update_profile(row["id"], {key: value for key, value in row.items() if key != "id"})
+
+    @abstractmethod
+    def search_profiles(self, query: str, limit: int) -> List[Dict[str, Any]]: ...
+
+    @abstractmethod
+    def insert_request(self, row: Dict[str, Any]) -> Optional[Dict[str, Any]]: ...
+
+    @abstractmethod
+    def get_request(self, request_id: str) -> Optional[Dict[str, Any]]: ...
+
+    @abstractmethod
+    def get_requests(self, request_ids: List[str]) -> List[Dict[str, Any]]: ...
+
+    @abstractmethod
+    def update_request(
+        self, request_id: str, fields: Dict[str, Any], expected_status: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Update a request, only while its status is expected_status when given; returns the updated rows"""
+
+    @abstractmethod
+    def pending_requests(self) -> List[Dict[str, Any]]:
+        """Every pending request, for loading the in-memory index"""
+
+    @abstractmethod
+    def pending_requests_near(
+        self,
+        lat: float,
+        lon: float,
+        radius_km: float,
+        exclude_user_id: Optional[str] = None,
+        since: Optional[datetime] = None,
+    ) -> List[Dict[str, Any]]:
+        """Pending requests in the bounding box of the search circle; callers apply the exact radius"""
+
+    @abstractmethod
+    def user_requests(self, user_id: str, status: Optional[str] = None) -> List[Dict[str, Any]]: ...
+
+    @abstractmethod
+    def insert_transaction(self, row: Dict[str, Any]) -> Optional[Dict[str, Any]]: ...
+
+    @abstractmethod
+    def user_transactions(self, user_id: str) -> List[Dict[str, Any]]: ...
+
+    @abstractmethod
+    def update_transaction(self, transaction_id: str, fields: Dict[str, Any]) -> List[Dict[str, Any]]: ...
+
+    @abstractmethod
+    def count_user_activity(self, user_id: str) -> Dict[str, Any]:
+        """Counters behind user stats: active/completed requests, transactions and completed amount"""
+
+    @abstractmethod
+    def delete_user_batch(self, table: str, user_id: str, limit: int) -> int:
+        """Delete up to limit of a user's rows from a table; returns the number deleted"""
+
+    def close(self) -> None:
+        """Release connections held by the backend"""
+
+
+class SupabaseStorage(Storage):
+    """Storage on the hosted Supabase (PostgREST) API"""
+
+    name = "supabase"
+
+    def __init__(self, client: Optional[Client] = None):
+        self.client = client
+
+    def get_client(self) -> Client:
+        """Get the Supabase client, creating it on first use"""
+        if self.client is None:
+            supabase_url = os.getenv("SUPABASE_URL")
+            supabase_key = os.getenv("SUPABASE_KEY")
+            if not supabase_url or not supabase_key:
+                raise ValueError("Supabase URL and Key must be provided")
+            self.client = create_client(supabase_url, supabase_key)
+            logger.info("Supabase client initialized successfully")
+        return self.client
+
+    def _first(self, result) -> Optional[Dict[str, Any]]:
+        return result.data[0] if result.data else None
+
+    def get_profile(self, user_id):
+        return self._first(self.get_client().table("profiles").select(PROFILE_COLUMNS).eq("id", user_id).execute())
+
+    def update_profile(self, user_id, fields):
+        return self._first(self.get_client().table("profiles").update(fields).eq("id", user_id).execute())
+
+    def search_profiles(self, query, limit):
+        result = self.get_client().table("profiles").select("*").or_(
+            f"name.ilike.%{query}%,email.ilike.%{query}%"
+        ).limit(limit).execute()
+        return result.data or []
+
+    def insert_request(self, row):
+        return self._first(self.get_client().table("requests").insert(row).execute())
+
+    def update_locations(self, rows):
+        if not LOCATION_UPDATE_RPC:
+            return super().update_locations(rows)
+        self.get_client().rpc(LOCATION_UPDATE_RPC, {"updates": rows}).execute()
+
+    def get_request(self, request_id):
+        return self._first(self.get_client().table("requests").select("*").eq("id", request_id).execute())
+
+    def get_requests(self, request_ids):
+        return self.get_client().table("requests").select("*").in_("id", request_ids).execute().data or []
+
+    def update_request(self, request_id, fields, expected_status=None):
+        query = self.get_client().table("requests").update(fields).eq("id", request_id)
+        if expected_status is not None:
+            query = query.eq("status", expected_status)
+        return query.execute().data or []
+
+    def pending_requests(self):
+        rows = []
+        start = 0
+        while True:
+            result = self.get_client().table("requests").select(REQUEST_COLUMNS)\
+                .eq("status", "pending")\
+                .order("id")\
+                .range(start, start + SUPABASE_PAGE_SIZE - 1)\
+                .execute()
+            rows.extend(result.data or [])
+            if not result.data or len(result.data) < SUPABASE_PAGE_SIZE:
+                return rows
+            start += SUPABASE_PAGE_SIZE
+
+    def pending_requests_near(self, lat, lon, radius_km, exclude_user_id=None, since=None):
+        if SUPABASE_NEARBY_RPC:
+            return self.get_client().rpc(SUPABASE_NEARBY_RPC, {
+                "lat": lat,
+                "lon": lon,
+                "radius_km": radius_km,
+                "exclude_user_id": exclude_user_id,
+                "since": since.isoformat() if since else None
+            }).execute().data or []
+        # Only pending requests inside the bounding box come over the wire
+        query = self.get_client().table("requests").select(REQUEST_COLUMNS).eq("status", "pending")
+        if exclude_user_id is not None:
+            query = query.neq("user_id", exclude_user_id)
+        if since is not None:
+            query = query.gte("created_at", since.isoformat())
+        return apply_bounding_box(query, lat, lon, radius_km).execute().data or []
+
+    def user_requests(self, user_id, status=None):
+        query = self.get_client().table("requests").select("*").eq("user_id", user_id)
+        if status:
+            query = query.eq("status", status)
+        return query.order("created_at", desc=True).execute().data or []
+
+    def insert_transaction(self, row):
+        return self._first(self.get_client().table("transactions").insert(row).execute())
+
+    def user_transactions(self, user_id):
+        return self.get_client().table("transactions").select("*").or_(
+            f"from_user.eq.{user_id},to_user.eq.{user_id}"
+        ).order("created_at", desc=True).execute().data or []
+
+    def update_transaction(self, transaction_id, fields):
+        return self.get_client().table("transactions").update(fields).eq("id", transaction_id).execute().data or []
+
+    def _scope(self, query, table: str, user_id: str):
+        columns = USER_SCOPES[table]
+        if len(columns) == 1:
+            return query.eq(columns[0], user_id)
+        return query.or_(",".join(f"{column}.eq.{user_id}" for column in columns))
+
+    def count_user_activity(self, user_id):
+        client = self.get_client()
+        counters = {}
+        for status, field in REQUEST_STATUS_FIELDS.items():
+            result = client.table("requests").select("id", count="exact", head=True).eq(
+                "user_id", user_id
+            ).eq("status", status).execute()
+            counters[field] = result.count or 0
+        result = self._scope(
+            client.table("transactions").select("id", count="exact", head=True), "transactions", user_id
+        ).execute()
+        counters["total_transactions"] = result.count or 0
+        result = self._scope(
+            client.table("transactions").select("amount"), "transactions", user_id
+        ).eq("status", "completed").execute()
+        counters["total_amount"] = sum(float(row["amount"]) for row in result.data or [])
+        return counters
+
+    def delete_user_batch(self, table, user_id, limit):
+        client = self.get_client()
+        result = self._scope(client.table(table).select("id"), table, user_id).limit(limit).execute()
+        ids = [row["id"] for row in result.data or []]
+        if not ids:
+            return 0
+        deleted = len(client.table(table).delete().in_("id", ids).execute().data or [])
+        if not deleted:
+            # e.g. row-level security hiding the rows from delete but not select
+            raise RuntimeError(f"Selected {len(ids)} rows from {table} but deleted none")
+        return deleted
+
+
+class SQLiteStorage(Storage):
+    """Local SQLite storage with an R*Tree index of pending request coordinates.
+
+    The R*Tree holds one degenerate box per pending request and is kept in
+    step by triggers, so radius queries are bounding-box lookups in the
+    index rather than scans. The database runs in WAL mode so readers
+    don't block the writer.
+    """
+
+    name = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS profiles (
+            id TEXT PRIMARY KEY, email TEXT, name TEXT, phone TEXT,
+            latitude REAL, longitude REAL, created_at TEXT, updated_at TEXT
+        );
+        CREATE TABLE IF NOT EXISTS requests (
+            pk INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, user_id TEXT NOT NULL, user_name TEXT,
+            amount REAL NOT NULL, type TEXT NOT NULL, latitude REAL NOT NULL, longitude REAL NOT NULL,
+            status TEXT NOT NULL, accepted_by TEXT, created_at TEXT, updated_at TEXT
+        );
+        CREATE INDEX IF NOT EXISTS requests_user_status ON requests (user_id, status);
+        CREATE TABLE IF NOT EXISTS transactions (
+            id TEXT PRIMARY KEY, request_id TEXT, from_user TEXT, to_user TEXT,
+            amount REAL NOT NULL, status TEXT NOT NULL, created_at TEXT, updated_at TEXT
+        );
+        CREATE INDEX IF NOT EXISTS transactions_from_user ON transactions (from_user);
+        CREATE INDEX IF NOT EXISTS transactions_to_user ON transactions (to_user);
+        CREATE VIRTUAL TABLE IF NOT EXISTS pending_request_locations USING rtree(
+            pk, min_lat, max_lat, min_lon, max_lon
+        );
+        CREATE TRIGGER IF NOT EXISTS requests_located_insert AFTER INSERT ON requests
+        WHEN NEW.status = 'pending' BEGIN
+            INSERT INTO pending_request_locations VALUES (NEW.pk, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude);
+        END;
+        CREATE TRIGGER IF NOT EXISTS requests_located_update AFTER UPDATE OF status, latitude, longitude ON requests
+        BEGIN
+            DELETE FROM pending_request_locations WHERE pk = OLD.pk;
+            INSERT INTO pending_request_locations
+            SELECT NEW.pk, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude WHERE NEW.status = 'pending';
+        END;
+        CREATE TRIGGER IF NOT EXISTS requests_located_delete AFTER DELETE ON requests BEGIN
+            DELETE FROM pending_request_locations WHERE pk = OLD.pk;
+        END;
+    """
+
+    COLUMNS = {
+        "profiles": ("id", "email", "name", "phone", "latitude", "longitude", "created_at", "updated_at"),
+        "requests": (
+            "id", "user_id", "user_name", "amount", "type", "latitude", "longitude",
+            "status", "accepted_by", "created_at", "updated_at"
+        ),
+        "transactions": ("id", "request_id", "from_user", "to_user", "amount", "status", "created_at", "updated_at"),
+    }
+
+    def __init__(self, path: str = SQLITE_DATABASE_PATH):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(self.SCHEMA)
+        return self._conn
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _query(self, sql: str, params: tuple = ()) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(row) for row in self._connection().execute(sql, params).fetchall()]
+
+    def _select(self, table: str, where: str, params: tuple, suffix: str = "") -> List[Dict[str, Any]]:
+        columns = ", ".join(self.COLUMNS[table])
+        return self._query(f"SELECT {columns} FROM {table} WHERE {where} {suffix}", params)
+
+    def _insert(self, table: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        now = datetime.now(timezone.utc).isoformat()
+        row = {"id": str(uuid.uuid4()), "created_at": now, "updated_at": now, **row}
+        columns = [column for column in self.COLUMNS[table] if column in row]
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                tuple(row[column] for column in columns),
+            )
+            conn.commit()
+        return self._select(table, "id = ?", (row["id"],))[0]
+
+    def _update(
+        self, table: str, row_id: str, fields: Dict[str, Any], expected_status: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        columns = [column for column in fields if column in self.COLUMNS[table] and column != "id"]
+        where, params = "id = ?", (row_id,)
+        if expected_status is not None:
+            where, params = "id = ? AND status = ?", (row_id, expected_status)
+        if not columns:
+            return self._select(table, where, params)
+        with self._lock:
+            conn = self._connection()
+            cursor = conn.execute(
+                f"UPDATE {table} SET {', '.join(f'{column} = ?' for column in columns)} WHERE {where}",
+                tuple(fields[column] for column in columns) + params,
+            )
+            conn.commit()
+            if not cursor.rowcount:
+                return []
+        return self._select(table, "id = ?", (row_id,))
+
+    def load(self, table: str, rows: List[Dict[str, Any]]) -> None:
+        """Insert or update rows in bulk, e.g. to seed a replica or a load test"""
+        columns = self.COLUMNS[table]
+        updates = ", ".join(f"{column} = excluded.{column}" for column in columns if column != "id")
+        with self._lock:
+            conn = self._connection()
+            conn.executemany(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+                f"ON CONFLICT (id) DO UPDATE SET {updates}",
+                [tuple(row.get(column) for column in columns) for row in rows],
+            )
+            conn.commit()
+
+    def get_profile(self, user_id):
+        rows = self._select("profiles", "id = ?", (user_id,))
+        return rows[0] if rows else None
+
+    def update_profile(self, user_id, fields):
+        rows = self._update("profiles", user_id, fields)
+        return rows[0] if rows else None
+
+    def update_locations(self, rows):
+        with self._lock:
+            conn = self._connection()
+            conn.executemany(
+                "UPDATE profiles SET latitude = ?, longitude = ?, updated_at = ? WHERE id = ?",
+                [(row["latitude"], row["longitude"], row["updated_at"], row["id"]) for row in rows],
+            )
+            conn.commit()
+
+    def search_profiles(self, query, limit):
+        pattern = f"%{query}%"
+        return self._select("profiles", "name LIKE ? OR email LIKE ?", (pattern, pattern), f"LIMIT {int(limit)}")
+
+    def insert_request(self, row):
+        return self._insert("requests", row)
+
+    def get_request(self, request_id):
+        rows = self._select("requests", "id = ?", (request_id,))
+        return rows[0] if rows else None
+
+    def get_requests(self, request_ids):
+        if not request_ids:
+            return []
+        return self._select("requests", f"id IN ({', '.join('?' * len(request_ids))})", tuple(request_ids))
+
+    def update_request(self, request_id, fields, expected_status=None):
+        return self._update("requests", request_id, fields, expected_status)
+
+    def pending_requests(self):
+        return self._select("requests", "status = 'pending'", (), "ORDER BY id")
+
+    def pending_requests_near(self, lat, lon, radius_km, exclude_user_id=None, since=None):
+        min_lat, max_lat, lon_ranges = bounding_box(lat, lon, radius_km)
+        where = ["l.min_lat >= ?", "l.max_lat <= ?"]
+        params: List[Any] = [min_lat, max_lat]
+        if lon_ranges:
+            where.append("(" + " OR ".join("(l.min_lon >= ? AND l.max_lon <= ?)" for _ in lon_ranges) + ")")
+            for lon_range in lon_ranges:
+                params.extend(lon_range)
+        if exclude_user_id is not None:
+            where.append("r.user_id != ?")
+            params.append(exclude_user_id)
+        if since is not None:
+            where.append("r.created_at >= ?")
+            params.append(since.isoformat())
+        columns = ", ".join(f"r.{column}" for column in REQUEST_COLUMNS.split(", "))
+        return self._query(
+            f"SELECT {columns} FROM pending_request_locations l JOIN requests r ON r.pk = l.pk "
+            f"WHERE {' AND '.join(where)}",
+            tuple(params),
+        )
+
+    def user_requests(self, user_id, status=None):
+        if status:
+            return self._select("requests", "user_id = ? AND status = ?", (user_id, status), "ORDER BY created_at DESC")
+        return self._select("requests", "user_id = ?", (user_id,), "ORDER BY created_at DESC")
+
+    def insert_transaction(self, row):
+        return self._insert("transactions", row)
+
+    def user_transactions(self, user_id):
+        return self._select(
+            "transactions", "from_user = ? OR to_user = ?", (user_id, user_id), "ORDER BY created_at DESC"
+        )
+
+    def update_transaction(self, transaction_id, fields):
+        return self._update("transactions", transaction_id, fields)
+
+    def count_user_activity(self, user_id):
+        requests = self._query(
+            "SELECT SUM(status = 'pending') AS active, SUM(status = 'completed') AS completed "
+            "FROM requests WHERE user_id = ?",
+            (user_id,),
+        )[0]
+        transactions = self._query(
+            "SELECT COUNT(*) AS total, SUM(CASE WHEN status = 'completed' THEN amount ELSE 0 END) AS amount "
+            "FROM transactions WHERE from_user = ? OR to_user = ?",
+            (user_id, user_id),
+        )[0]
+        return {
+            "active_requests": requests["active"] or 0,
+            "completed_requests": requests["completed"] or 0,
+            "total_transactions": transactions["total"] or 0,
+            "total_amount": float(transactions["amount"] or 0),
+        }
+
+    def delete_user_batch(self, table, user_id, limit):
+        where = " OR ".join(f"{column} = ?" for column in USER_SCOPES[table])
+        params = (user_id,) * len(USER_SCOPES[table])
+        with self._lock:
+            conn = self._connection()
+            cursor = conn.execute(
+                f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} WHERE {where} LIMIT ?)",
+                params + (int(limit),),
+            )
+            conn.commit()
+            return cursor.rowcount
+
+
+def create_storage(backend: Optional[str] = None) -> Storage:
+    """Storage selected by STORAGE_BACKEND: "supabase" (default) or "sqlite" """
+    backend = (backend or os.getenv("STORAGE_BACKEND", "supabase")).lower()
+    if backend == "sqlite":
+        return SQLiteStorage()
+    if backend == "supabase":
+        return SupabaseStorage()
+    raise ValueError(f"Unknown storage backend: {backend}")
@@ -0,0 +1,274 @@
+"""In-process stand-ins for Supabase and GraphHopper used by the load harness."""
+import asyncio
+import copy
+import json
+import random
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+
+class FakeResult:
+    def __init__(self, data: List[Dict[str, Any]], count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+
+def _compare(a: Any, b: Any) -> int:
+    try:
+        a, b = float(a), float(b)
+    except (TypeError, ValueError):
+        a, b = str(a), str(b)
+    return (a > b) - (a < b)
+
+
+class FakeQuery:
+    """The subset of the postgrest query builder the backend uses"""
+
+    def __init__(self, db: "FakeSupabase", table: str):
+        self.db = db
+        self.table = table
+        self.op = "select"
+        self.columns = "*"
+        self.payload: Any = None
+        self.filters: List[Callable[[Dict[str, Any]], bool]] = []
+        self.count_method: Optional[str] = None
+        self.head = False
+        self.order_by: Optional[tuple] = None
+        self.row_range: Optional[tuple] = None
+        self.row_limit: Optional[int] = None
+
+    def select(self, columns: str = "*", count: Optional[str] = None, head: Optional[bool] = None):
+        self.op, self.columns, self.count_method, self.head = "select", columns, count, bool(head)
+        return self
+
+    def insert(self, data):
+        self.op, self.payload = "insert", data
+        return self
+
+    def update(self, data):
+        self.op, self.payload = "update", data
+        return self
+
+    def upsert(self, data, **kwargs):
+        self.op, self.payload = "upsert", data
+        return self
+
+    def delete(self):
+        self.op = "delete"
+        return self
+
+    def _filter(self, column: str, test: Callable[[Any], bool]):
+        self.filters.append(lambda row: test(row.get(column)))
+        return self
+
+    def eq(self, column, value):
+        return self._filter(column, lambda x: str(x) == str(value))
+
+    def neq(self, column, value):
+        return self._filter(column, lambda x: str(x) != str(value))
+
+    def gte(self, column, value):
+        return self._filter(column, lambda x: x is not None and _compare(x, value) >= 0)
+
+    def lte(self, column, value):
+        return self._filter(column, lambda x: x is not None and _compare(x, value) <= 0)
+
+    def gt(self, column, value):
+        return self._filter(column, lambda x: x is not None and _compare(x, value) > 0)
+
+    def lt(self, column, value):
+        return self._filter(column, lambda x: x is not None and _compare(x, value) < 0)
+
+    def in_(self, column, values):
+        values = {str(value) for value in values}
+        return self._filter(column, lambda x: str(x) in values)
+
+    def or_(self, expression: str):
+        tests = []
+        for part in expression.split(","):
+            column, op, value = part.split(".", 2)
+            tests.append((column, op, value))
+
+        def matches(row):
+            for column, op, value in tests:
+                x = row.get(column)
+                if x is None:
+                    continue
+                if op == "eq" and str(x) == value:
+                    return True
+                if op == "gte" and _compare(x, value) >= 0:
+                    return True
+                if op == "lte" and _compare(x, value) <= 0:
+                    return True
+                if op == "ilike" and value.strip("%").lower() in str(x).lower():
+                    return True
+            return False
+
+        self.filters.append(matches)
+        return self
+
+    def order(self, column, desc=False):
+        self.order_by = (column, desc)
+        return self
+
+    def range(self, start, end):
+        self.row_range = (start, end)
+        return self
+
+    def limit(self, n):
+        self.row_limit = n
+        return self
+
+    def execute(self) -> FakeResult:
+        self.db.sleep()
+        with self.db.lock:
+            self.db.calls += 1
+            rows = self.db.tables.setdefault(self.table, [])
+            if self.op in ("insert", "upsert"):
+                items = self.payload if isinstance(self.payload, list) else [self.payload]
+                out = []
+                for item in items:
+                    existing = self.db.by_id(self.table, item.get("id")) if self.op == "upsert" else None
+                    if existing is not None:
+                        existing.update(item)
+                        out.append(dict(existing))
+                    else:
+                        item = dict(item)
+                        item.setdefault("id", str(uuid.uuid4()))
+                        rows.append(item)
+                        self.db.index_row(self.table, item)
+                        out.append(dict(item))
+                return FakeResult(out)
+
+            matched = [row for row in rows if all(test(row) for test in self.filters)]
+            if self.op == "update":
+                for row in matched:
+                    row.update(self.payload)
+                return FakeResult(copy.deepcopy(matched))
+            if self.op == "delete":
+                doomed = {id(row) for row in matched}
+                self.db.tables[self.table] = [row for row in rows if id(row) not in doomed]
+                self.db.reindex(self.table)
+                return FakeResult(matched)
+
+            total = len(matched)
+            if self.head:
+                return FakeResult([], total)
+            if self.order_by:
+                column, desc = self.order_by
+                matched.sort(key=lambda row: str(row.get(column)), reverse=desc)
+            if self.row_range:
+                matched = matched[self.row_range[0]:self.row_range[1] + 1]
+            if self.row_limit is not None:
+                matched = matched[:self.row_limit]
+            if self.columns != "*":
+                keep = [column.strip() for column in self.columns.split(",")]
+                matched = [{column: row.get(column) for column in keep} for row in matched]
+            else:
+                matched = [dict(row) for row in matched]
+            return FakeResult(matched, total if self.count_method else None)
+
+
+class FakeAuth:
+    def __init__(self, db: "FakeSupabase"):
+        self.db = db
+
+    def get_user(self, token: str):
+        self.db.sleep()
+        user_id = self.db.tokens.get(token)
+        if user_id is None:
+            raise Exception("Invalid token")
+        return SimpleNamespace(user=SimpleNamespace(id=user_id, email=f"{user_id}@example.com"))
+
+
+class FakeSupabase:
+    """Thread-safe in-memory Supabase client with a fixed per-call latency"""
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency = latency_ms / 1000
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        self.tokens: Dict[str, str] = {}
+        self.calls = 0
+        self.lock = threading.Lock()
+        self.auth = FakeAuth(self)
+        self._ids: Dict[str, Dict[str, Dict[str, Any]]] = {}
+
+    def sleep(self) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+
+    def by_id(self, table: str, row_id: Any) -> Optional[Dict[str, Any]]:
+        return self._ids.get(table, {}).get(str(row_id))
+
+    def index_row(self, table: str, row: Dict[str, Any]) -> None:
+        self._ids.setdefault(table, {})[str(row.get("id"))] = row
+
+    def load(self, table: str, rows: List[Dict[str, Any]]) -> None:
+        """Replace a table's contents"""
+        with self.lock:
+            self.tables[table] = rows
+            self.reindex(table)
+
+    def reindex(self, table: str) -> None:
+        self._ids[table] = {str(row.get("id")): row for row in self.tables.get(table, [])}
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def rpc(self, name: str, params: Dict[str, Any]):
+        return SimpleNamespace(execute=lambda: FakeResult([]))
+
+
+def graphhopper_transport(latency_ms: float = 0.0, jitter_ms: float = 0.0) -> httpx.MockTransport:
+    """Mock GraphHopper API answering route, matrix and geocode calls after a delay"""
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        delay = latency_ms + random.uniform(0, jitter_ms)
+        if delay:
+            await asyncio.sleep(delay / 1000)
+        if request.url.path.endswith("/route"):
+            return httpx.Response(200, json={"paths": [{"distance": 1200.0, "time": 860000, "points": ""}]})
+        if request.url.path.endswith("/matrix"):
+            body = json.loads(request.content)
+            rows, cols = len(body["from_points"]), len(body["to_points"])
+            return httpx.Response(200, json={
+                "distances": [[1000.0 + j for j in range(cols)] for _ in range(rows)],
+                "times": [[900.0 + j for j in range(cols)] for _ in range(rows)],
+            })
+        if request.url.path.endswith("/geocode"):
+            return httpx.Response(200, json={"hits": [{"name": "Main Street", "city": "Bengaluru"}]})
+        return httpx.Response(404)
+
+    return httpx.MockTransport(handler)
+
+
+def synthetic_requests(
+    n: int,
+    center: tuple = (12.97, 77.59),
+    spread_deg: float = 0.3,
+    users: int = 1000,
+    seed: int = 1,
+) -> List[Dict[str, Any]]:
+    """n pending request rows scattered around a point"""
+    rng = random.Random(seed)
+    return [
+        {
+            "id": f"req-{i}",
+            "user_id": f"user-{i % users}",
+            "user_name": f"User {i % users}",
+            "amount": float(rng.randint(1, 100) * 50),
+            "type": "Need Cash" if i % 2 else "Need Online Payment",
+            "latitude": center[0] + rng.uniform(-spread_deg, spread_deg),
+            "longitude": center[1] + rng.uniform(-spread_deg, spread_deg),
+            "status": "pending",
+            "accepted_by": None,
+            "created_at": "2026-01-01T00:00:00+00:00",
+            "updated_at": "2026-01-01T00:00:00+00:00",
+        }
+        for i in range(n)
+    ]
@@ -0,0 +1,183 @@
+"""End-to-end load harness for the API against in-process fakes.
+
+Drives the FastAPI app through an ASGI transport with Supabase and
+GraphHopper replaced by fakes with configurable latency, and reports
+p50/p95/p99 latency, throughput and memory per endpoint. With
+--storage sqlite the data lives in a temporary SQLite database instead,
+and only Supabase Auth is faked. Run from backend/:
+
+    python -m benchmarks.load --rows 20000 --requests 500 --concurrency 20 --output load.json
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+
+import httpx
+
+from benchmarks.fakes import FakeSupabase, graphhopper_transport, synthetic_requests
+from benchmarks.report import max_rss_mb, summarize, write_report
+
+CENTER = (12.97, 77.59)
+ENDPOINTS = ("user_me", "nearby", "nearby_limit", "recent", "changes", "location", "route", "matrix", "create")
+
+RequestFactory = Callable[[int], Tuple[str, str, Dict[str, Any]]]
+
+
+def configure_environment(workdir: str, storage: str) -> None:
+    """Settings that must be in place before the app modules are imported"""
+    os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:1")
+    os.environ.setdefault("SUPABASE_KEY", "benchmark")
+    os.environ["GEOCODE_CACHE_PATH"] = os.path.join(workdir, "geocode_cache.sqlite3")
+    os.environ["ERASURE_DB_PATH"] = os.path.join(workdir, "erasure_jobs.sqlite3")
+    os.environ["STORAGE_BACKEND"] = storage
+    os.environ["SQLITE_DATABASE_PATH"] = os.path.join(workdir, "payswap.sqlite3")
+
+
+def request_factories(users: int, request_ids: List[str]) -> Dict[str, RequestFactory]:
+    """Per endpoint, a function from a sequence number to (method, url, httpx kwargs)"""
+    rng = random.Random(7)
+
+    def auth(i: int) -> Dict[str, str]:
+        return {"Authorization": f"Bearer token-{i % users}"}
+
+    def jitter() -> float:
+        return rng.uniform(-0.05, 0.05)
+
+    return {
+        "user_me": lambda i: ("GET", "/api/user/me", {"headers": auth(i)}),
+        "nearby": lambda i: ("GET", "/api/requests/nearby", {"headers": auth(i), "params": {"radius": 5}}),
+        "nearby_limit": lambda i: (
+            "GET", "/api/requests/nearby", {"headers": auth(i), "params": {"radius": 5, "limit": 50}}
+        ),
+        "recent": lambda i: ("GET", "/api/requests/recent", {"headers": auth(i), "params": {"minutes": 60}}),
+        "changes": lambda i: ("GET", "/api/requests/changes", {"headers": auth(i), "params": {"radius": 5}}),
+        "location": lambda i: ("POST", "/api/user/location", {
+            "headers": auth(i), "json": {"latitude": CENTER[0] + jitter(), "longitude": CENTER[1] + jitter()}
+        }),
+        "route": lambda i: ("GET", "/api/route", {"headers": auth(i), "params": {
+            "start_lat": CENTER[0] + jitter(), "start_lng": CENTER[1] + jitter(),
+            "end_lat": CENTER[0] + jitter(), "end_lng": CENTER[1] + jitter(),
+        }}),
+        "matrix": lambda i: ("POST", "/api/route/matrix", {
+            "headers": auth(i), "json": {"request_ids": rng.sample(request_ids, min(10, len(request_ids)))}
+        }),
+        "create": lambda i: ("POST", "/api/requests", {
+            "headers": auth(i), "json": {"amount": 500, "type": "Need Cash" if i % 2 else "Need Online Payment"}
+        }),
+    }
+
+
+async def drive(
+    client: httpx.AsyncClient,
+    factory: RequestFactory,
+    total: int,
+    concurrency: int,
+    trace_memory: bool,
+) -> Dict[str, Any]:
+    """Send total requests from concurrency workers; latency, status and memory summary"""
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    counter = iter(range(total))
+
+    async def worker():
+        for i in counter:
+            method, url, kwargs = factory(i)
+            start = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    peak_kb = None
+    if trace_memory:
+        peak_kb = tracemalloc.get_traced_memory()[1] / 1e3
+        tracemalloc.stop()
+
+    return {
+        **summarize(latencies),
+        "throughput_rps": total / elapsed if elapsed else 0.0,
+        "statuses": statuses,
+        "peak_alloc_kb": peak_kb,
+        "rss_mb": max_rss_mb(),
+    }
+
+
+async def run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    import database
+    import main
+
+    fake = FakeSupabase(latency_ms=args.db_latency_ms)
+    rows = synthetic_requests(args.rows, CENTER, users=args.users)
+    rng = random.Random(3)
+    profiles = [
+        {
+            "id": f"user-{i}", "email": f"user-{i}@example.com", "name": f"User {i}",
+            "latitude": CENTER[0] + rng.uniform(-0.1, 0.1), "longitude": CENTER[1] + rng.uniform(-0.1, 0.1),
+        }
+        for i in range(args.users)
+    ]
+    # Data goes to the selected backend; tokens are always checked against the fake's auth
+    storage = database.db.storage if args.storage == "sqlite" else fake
+    storage.load("requests", rows)
+    storage.load("profiles", profiles)
+    storage.load("transactions", [])
+    fake.tokens = {f"token-{i}": f"user-{i}" for i in range(args.users)}
+
+    if args.storage == "supabase":
+        database.db.storage.client = fake
+    main.auth_backend.client = fake
+    main.graphhopper.api_key = "benchmark"
+    main.graphhopper.transport = graphhopper_transport(args.graphhopper_latency_ms, args.graphhopper_jitter_ms)
+
+    factories = request_factories(args.users, [row["id"] for row in rows])
+    results = []
+    async with main.lifespan(main.app):
+        while not main.request_index.ready:
+            await asyncio.sleep(0.05)
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            for endpoint in args.endpoints:
+                fake.calls = 0
+                summary = await drive(client, factories[endpoint], args.requests, args.concurrency, args.trace_memory)
+                results.append({"endpoint": endpoint, **summary, "db_calls": fake.calls})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000, help="Pending requests in the fake database")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=500, help="Requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--storage", choices=("supabase", "sqlite"), default="supabase", help="Backend holding the data")
+    parser.add_argument("--db-latency-ms", type=float, default=5.0, help="Latency of the fake Supabase")
+    parser.add_argument("--graphhopper-latency-ms", type=float, default=50.0)
+    parser.add_argument("--graphhopper-jitter-ms", type=float, default=20.0)
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="Comma-separated subset of: " + ", ".join(ENDPOINTS))
+    parser.add_argument("--trace-memory", action="store_true", help="Record peak allocations per endpoint (slower)")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+    args.endpoints = [endpoint for endpoint in args.endpoints.split(",") if endpoint]
+    unknown = set(args.endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        configure_environment(workdir, args.storage)
+        results = asyncio.run(run(args))
+
+    config = {key: value for key, value in vars(args).items() if key != "output"}
+    write_report("load", config, results, args.output)
+
+
+if __name__ == "__main__":
+    main()
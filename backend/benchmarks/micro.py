@@ -0,0 +1,94 @@
+"""Micro-benchmarks of the distance and filtering kernels.
+
+Run from backend/:
+
+    python -m benchmarks.micro --sizes 1000,10000,100000,1000000 --output micro.json
+"""
+import argparse
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+from benchmarks.fakes import synthetic_requests
+from benchmarks.report import summarize, write_report
+from distance import calculate_distance, coordinate_arrays, haversine_batch, nearby_rows, within_radius
+from geo_index import GeoIndex
+from matching import MatchingEngine
+
+CENTER = (12.97, 77.59)
+# The scalar loop is too slow to be worth running beyond this size
+SCALAR_MAX_ROWS = 100000
+
+
+def measure(func: Callable[[], Any], repeat: int) -> Dict[str, Any]:
+    """Latency summary over repeat calls, plus the peak memory allocated by one call"""
+    func()  # warm up caches and lazily built arrays
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {**summarize(samples), "peak_alloc_kb": peak / 1e3}
+
+
+def run(sizes: List[int], repeat: int, radius_km: float) -> List[Dict[str, Any]]:
+    results = []
+    lat, lon = CENTER
+    for n in sizes:
+        rows = synthetic_requests(n, CENTER)
+        lats, lons = coordinate_arrays(rows)
+
+        kernels: Dict[str, Callable[[], Any]] = {
+            "haversine_batch": lambda: haversine_batch(lat, lon, lats, lons),
+            "within_radius": lambda: within_radius(lat, lon, lats, lons, radius_km),
+            "coordinate_arrays": lambda: coordinate_arrays(rows),
+            "nearby_rows": lambda: nearby_rows(lat, lon, rows, radius_km),
+            "nearby_rows_limit_50": lambda: nearby_rows(lat, lon, rows, radius_km, limit=50),
+        }
+        if n <= SCALAR_MAX_ROWS:
+            kernels["calculate_distance_loop"] = lambda: [
+                calculate_distance(lat, lon, row["latitude"], row["longitude"]) for row in rows
+            ]
+
+        index = GeoIndex()
+        start = time.perf_counter()
+        index.load(rows)
+        results.append({
+            "kernel": "geo_index_load", "rows": n,
+            **summarize([(time.perf_counter() - start) * 1000]), "peak_alloc_kb": None
+        })
+        kernels["geo_index_query_limit_50"] = lambda: index.query(
+            lat, lon, radius_km, predicate=lambda row: row.get("user_id") != "user-0", limit=50
+        )
+
+        engine = MatchingEngine()
+        for row in rows:
+            engine.upsert(row)
+        probe = {**rows[0], "id": "probe", "user_id": "probe-user"}
+        kernels["matching_find_matches"] = lambda: engine.find_matches(probe, radius_km)
+
+        for name, func in kernels.items():
+            results.append({"kernel": name, "rows": n, **measure(func, repeat)})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000", help="Comma-separated row counts")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--radius", type=float, default=5.0, help="Search radius in km")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    results = run(sizes, args.repeat, args.radius)
+    write_report("micro", {"sizes": sizes, "repeat": args.repeat, "radius_km": args.radius}, results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Shared helpers for benchmark reports."""
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+
+def percentile(sorted_values: Sequence[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted sequence"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(q / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(samples_ms: List[float]) -> Dict[str, float]:
+    values = sorted(samples_ms)
+    return {
+        "count": len(values),
+        "mean_ms": sum(values) / len(values) if values else 0.0,
+        "p50_ms": percentile(values, 50),
+        "p95_ms": percentile(values, 95),
+        "p99_ms": percentile(values, 99),
+        "max_ms": values[-1] if values else 0.0,
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def max_rss_mb() -> float:
+    """Peak resident set size of this process"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes elsewhere
+    return rss / 1e6 if sys.platform == "darwin" else rss / 1e3
+
+
+def write_report(kind: str, config: Dict[str, Any], results: List[Dict[str, Any]], output: Optional[str]) -> None:
+    """Print the report as JSON, or write it to output"""
+    report = {
+        "benchmark": kind,
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": config,
+        "max_rss_mb": max_rss_mb(),
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
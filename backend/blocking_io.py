@@ -0,0 +1,21 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+# Upper bound on blocking calls (Supabase queries, HTTP) running at once
+IO_THREAD_POOL_SIZE = int(os.getenv("IO_THREAD_POOL_SIZE", "32"))
+
+_executor = ThreadPoolExecutor(max_workers=IO_THREAD_POOL_SIZE, thread_name_prefix="blocking-io")
+
+
+async def run_blocking(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Run a blocking call on the bounded I/O pool without stalling the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+def shutdown() -> None:
+    """Stop accepting work; queued calls are cancelled"""
+    _executor.shutdown(wait=False, cancel_futures=True)
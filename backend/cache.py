@@ -0,0 +1,102 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries expire after a time-to-live.
+
+    Safe to share between the event loop and worker threads.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, count=False) is not None
+
+    def get(self, key: Hashable, default: Any = None, count: bool = True) -> Any:
+        """Return a live entry and mark it recently used"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._data.move_to_end(key)
+                if count:
+                    self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._data[key]
+            if count:
+                self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Store an entry, evicting the least recently used one when full"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove an entry and return its value"""
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def keys(self) -> List[Hashable]:
+        """Keys from least to most recently used, including expired ones"""
+        with self._lock:
+            return list(self._data)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class SingleFlight:
+    """Coalesces concurrent async calls with the same key into one.
+
+    The first caller starts the work; callers arriving while it is in
+    flight await the same result instead of starting their own.
+    """
+
+    def __init__(self):
+        self.coalesced = 0
+        self._inflight: Dict[Hashable, "asyncio.Future"] = {}
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def run(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shielded so one caller going away doesn't cancel the others
+        return await asyncio.shield(task)
@@ -0,0 +1,60 @@
+import os
+import uuid
+from collections import deque
+from itertools import islice
+from typing import Any, Dict, List, Optional
+
+CHANGELOG_SIZE = int(os.getenv("CHANGELOG_SIZE", "100000"))
+
+
+def tombstone(row: Dict[str, Any]) -> Dict[str, Any]:
+    """A removed request reduced to what radius filtering needs, without the owner's details"""
+    return {"id": str(row.get("id")), "latitude": row.get("latitude"), "longitude": row.get("longitude"), "status": "deleted"}
+
+
+class ChangeLog:
+    """Bounded, ordered log of pending-request changes.
+
+    Every change gets the next server sequence number. Inserts and updates
+    carry the row; requests that leave the pending set (accepted, completed,
+    cancelled) are recorded as tombstones. The epoch changes on every process
+    start, so clients holding a sequence from another process resync.
+    """
+
+    def __init__(self, maxlen: int = CHANGELOG_SIZE):
+        self.epoch = uuid.uuid4().hex[:12]
+        self.seq = 0
+        self._entries: deque = deque(maxlen=maxlen)
+
+    def append(self, op: str, row: Dict[str, Any]) -> int:
+        """Record an insert, update or delete and return its sequence number"""
+        self.seq += 1
+        self._entries.append({"seq": self.seq, "op": op, "id": str(row.get("id")), "request": row})
+        return self.seq
+
+    def redact(self, user_id: str) -> int:
+        """Turn a user's logged changes into delete tombstones; returns how many were rewritten"""
+        redacted = 0
+        for entry in self._entries:
+            if entry["request"].get("user_id") == user_id:
+                entry["op"] = "delete"
+                entry["request"] = tombstone(entry["request"])
+                redacted += 1
+        return redacted
+
+    def since(self, seq: int, epoch: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+        """Changes after seq, oldest first; None when seq can't be served and the client must resync"""
+        if epoch != self.epoch or seq > self.seq:
+            return None
+        if seq == self.seq:
+            return []
+        if not self._entries or self._entries[0]["seq"] > seq + 1:
+            # Entries after seq have been evicted
+            return None
+        # Sequence numbers are contiguous, so the offset is direct
+        start = seq + 1 - self._entries[0]["seq"]
+        return list(islice(self._entries, start, None))
+
+
+# Global change log of pending requests
+request_changes = ChangeLog()
@@ -0,0 +1,53 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+
+from cache import TTLCache
+
+CLAIM_CACHE_SIZE = int(os.getenv("CLAIM_CACHE_SIZE", "50000"))
+CLAIM_CACHE_TTL_SECONDS = float(os.getenv("CLAIM_CACHE_TTL_SECONDS", "3600"))
+
+
+class ClaimQueue:
+    """Serializes contending claims on the same request within this process.
+
+    Contenders for one request queue on a per-request lock, so only one
+    conditional write is in flight at a time. Once a request is claimed the
+    claimant is remembered, and everyone still queued or arriving later is
+    answered from memory without touching the database.
+    """
+
+    def __init__(self, maxsize: int = CLAIM_CACHE_SIZE, ttl: float = CLAIM_CACHE_TTL_SECONDS):
+        self.claimed = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.rejected = 0
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._waiting: Dict[str, int] = {}
+
+    def claimed_by(self, request_id: str) -> Optional[str]:
+        """The user who claimed a request, if it is known to be taken"""
+        return self.claimed.get(request_id, count=False)
+
+    def mark_claimed(self, request_id: str, user_id: Any) -> None:
+        self.claimed.set(request_id, str(user_id))
+
+    @asynccontextmanager
+    async def lock(self, request_id: str):
+        """Hold the request's claim lock; the lock is dropped once nobody waits on it"""
+        lock = self._locks.setdefault(request_id, asyncio.Lock())
+        self._waiting[request_id] = self._waiting.get(request_id, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._waiting[request_id] -= 1
+            if not self._waiting[request_id]:
+                del self._waiting[request_id]
+                del self._locks[request_id]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"claimed": len(self.claimed), "contended": len(self._locks), "rejected": self.rejected}
+
+
+# Global claim queue for request accepts
+request_claims = ClaimQueue()
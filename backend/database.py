@@ -1,47 +1,52 @@
-from supabase import create_client, Client
 import os
 from typing import Optional, Dict, Any, List
 import logging
 from datetime import datetime, timezone
 
+from backends import Storage, create_storage
+from blocking_io import run_blocking
+from cache import TTLCache
+from distance import nearby_rows
+from erasure import ErasureJobs
+from metrics import observe_nearby, timed
+from profiling import phase
+from user_stats import UserStats
+
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "50000"))
+PROFILE_CACHE_TTL_SECONDS = float(os.getenv("PROFILE_CACHE_TTL_SECONDS", "60"))
+
+# Profiles by user id, kept current by the location write paths
+profile_cache = TTLCache(maxsize=PROFILE_CACHE_SIZE, ttl=PROFILE_CACHE_TTL_SECONDS)
+
 class Database:
-    def __init__(self):
-        self.supabase: Optional[Client] = None
-        self.initialized = False
-        
-    def initialize(self):
-        """Initialize the Supabase client"""
-        try:
-            supabase_url = os.getenv("SUPABASE_URL")
-            supabase_key = os.getenv("SUPABASE_KEY")
-            
-            if not supabase_url or not supabase_key:
-                raise ValueError("Supabase URL and Key must be provided")
-                
-            self.supabase = create_client(supabase_url, supabase_key)
-            self.initialized = True
-            logger.info("Supabase client initialized successfully")
-        except Exception as e:
-            logger.error(f"Failed to initialize Supabase client: {e}")
-            raise
+    """Async data-access layer; blocking storage calls run on the bounded I/O pool"""
+
+    def __init__(self, storage: Optional[Storage] = None):
+        self.storage = storage or create_storage()
+
+    def close(self):
+        """Release the storage backend's connections"""
+        self.storage.close()
 
-    def get_client(self) -> Client:
-        """Get the Supabase client instance"""
-        if not self.initialized or not self.supabase:
-            self.initialize()
-        return self.supabase
+    async def run(self, operation: str, *args: Any) -> Any:
+        """Run a storage primitive on the I/O pool, timed under the backend's name; errors propagate"""
+        func = getattr(self.storage, operation)
+        return await run_blocking(timed(self.storage.name, operation, func), *args)
 
     async def get_user_by_id(self, user_id: str) -> Optional[Dict[str, Any]]:
         """Get user by ID"""
+        cached = profile_cache.get(user_id)
+        if cached is not None:
+            return cached
         try:
-            result = self.get_client().table("profiles").select("*").eq("id", user_id).execute()
-            if result.data and len(result.data) > 0:
-                return result.data[0]
-            return None
+            result = await self.run("get_profile", user_id)
+            if result:
+                profile_cache.set(user_id, result)
+            return result
         except Exception as e:
             logger.error(f"Error getting user by ID {user_id}: {e}")
             return None
@@ -49,13 +54,15 @@ class Database:
     async def update_user_location(self, user_id: str, latitude: float, longitude: float) -> bool:
         """Update user location"""
         try:
-            result = self.get_client().table("profiles").update({
+            result = await self.run("update_profile", user_id, {
                 "latitude": latitude,
                 "longitude": longitude,
                 "updated_at": datetime.now(timezone.utc).isoformat()
-            }).eq("id", user_id).execute()
+            })
             
-            return bool(result.data)
+            if result:
+                profile_cache.set(user_id, result)
+            return bool(result)
         except Exception as e:
             logger.error(f"Error updating user location for {user_id}: {e}")
             return False
@@ -63,10 +70,11 @@ class Database:
     async def create_request(self, request_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """Create a new request"""
         try:
-            result = self.get_client().table("requests").insert(request_data).execute()
-            if result.data and len(result.data) > 0:
-                return result.data[0]
-            return None
+            with phase("insert"):
+                result = await self.run("insert_request", request_data)
+            if result:
+                user_stats.request_changed(result, created=True)
+            return result
         except Exception as e:
             logger.error(f"Error creating request: {e}")
             return None
@@ -74,10 +82,7 @@ class Database:
     async def get_request_by_id(self, request_id: str) -> Optional[Dict[str, Any]]:
         """Get request by ID"""
         try:
-            result = self.get_client().table("requests").select("*").eq("id", request_id).execute()
-            if result.data and len(result.data) > 0:
-                return result.data[0]
-            return None
+            return await self.run("get_request", request_id)
         except Exception as e:
             logger.error(f"Error getting request by ID {request_id}: {e}")
             return None
@@ -85,8 +90,10 @@ class Database:
     async def update_request(self, request_id: str, update_data: Dict[str, Any]) -> bool:
         """Update request"""
         try:
-            result = self.get_client().table("requests").update(update_data).eq("id", request_id).execute()
-            return bool(result.data)
+            rows = await self.run("update_request", request_id, update_data)
+            for row in rows:
+                user_stats.request_changed(row)
+            return bool(rows)
         except Exception as e:
             logger.error(f"Error updating request {request_id}: {e}")
             return False
@@ -94,27 +101,18 @@ class Database:
     async def get_nearby_requests(self, user_lat: float, user_lon: float, radius_km: float = 5.0) -> List[Dict[str, Any]]:
         """Get nearby requests using Haversine formula"""
         try:
-            # First get all pending requests
-            result = self.get_client().table("requests").select("*").eq("status", "pending").execute()
+            # The storage narrows to the bounding box; the exact radius is applied here
+            with phase("query"):
+                rows = await self.run("pending_requests_near", user_lat, user_lon, radius_km)
             
-            if not result.data:
+            if not rows:
                 return []
             
-            # Filter requests by distance
-            nearby_requests = []
-            for request in result.data:
-                distance = self._calculate_distance(
-                    user_lat, user_lon,
-                    request["latitude"], request["longitude"]
-                )
-                if distance <= radius_km:
-                    request_with_distance = request.copy()
-                    request_with_distance["distance_km"] = distance
-                    nearby_requests.append(request_with_distance)
-            
-            # Sort by distance (closest first)
-            nearby_requests.sort(key=lambda x: x["distance_km"])
-            return nearby_requests
+            # Filter by distance and sort closest first in one vectorized pass
+            with phase("filter"):
+                nearby = nearby_rows(user_lat, user_lon, rows, radius_km)
+            observe_nearby(self.storage.name, len(rows), len(nearby))
+            return nearby
             
         except Exception as e:
             logger.error(f"Error getting nearby requests: {e}")
@@ -123,13 +121,7 @@ class Database:
     async def get_user_requests(self, user_id: str, status: Optional[str] = None) -> List[Dict[str, Any]]:
         """Get requests for a specific user"""
         try:
-            query = self.get_client().table("requests").select("*").eq("user_id", user_id)
-            
-            if status:
-                query = query.eq("status", status)
-                
-            result = query.order("created_at", desc=True).execute()
-            return result.data if result.data else []
+            return await self.run("user_requests", user_id, status)
         except Exception as e:
             logger.error(f"Error getting requests for user {user_id}: {e}")
             return []
@@ -137,10 +129,10 @@ class Database:
     async def create_transaction(self, transaction_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """Create a new transaction"""
         try:
-            result = self.get_client().table("transactions").insert(transaction_data).execute()
-            if result.data and len(result.data) > 0:
-                return result.data[0]
-            return None
+            result = await self.run("insert_transaction", transaction_data)
+            if result:
+                user_stats.transaction_changed(result, created=True)
+            return result
         except Exception as e:
             logger.error(f"Error creating transaction: {e}")
             return None
@@ -148,11 +140,7 @@ class Database:
     async def get_user_transactions(self, user_id: str) -> List[Dict[str, Any]]:
         """Get transactions for a specific user"""
         try:
-            result = self.get_client().table("transactions").select("*").or_(
-                f"from_user.eq.{user_id},to_user.eq.{user_id}"
-            ).order("created_at", desc=True).execute()
-            
-            return result.data if result.data else []
+            return await self.run("user_transactions", user_id)
         except Exception as e:
             logger.error(f"Error getting transactions for user {user_id}: {e}")
             return []
@@ -160,56 +148,22 @@ class Database:
     async def update_transaction_status(self, transaction_id: str, status: str) -> bool:
         """Update transaction status"""
         try:
-            result = self.get_client().table("transactions").update({
+            rows = await self.run("update_transaction", transaction_id, {
                 "status": status,
                 "updated_at": datetime.now(timezone.utc).isoformat()
-            }).eq("id", transaction_id).execute()
+            })
             
-            return bool(result.data)
+            for row in rows:
+                user_stats.transaction_changed(row)
+            return bool(rows)
         except Exception as e:
             logger.error(f"Error updating transaction {transaction_id}: {e}")
             return False
 
-    def _calculate_distance(self, lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-        """Calculate distance between two points using Haversine formula"""
-        import math
-        
-        R = 6371  # Earth radius in kilometers
-        dlat = math.radians(lat2 - lat1)
-        dlon = math.radians(lon2 - lon1)
-        
-        a = (math.sin(dlat/2) * math.sin(dlat/2) +
-             math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) *
-             math.sin(dlon/2) * math.sin(dlon/2))
-        
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-        return R * c
-
     async def get_user_stats(self, user_id: str) -> Dict[str, Any]:
-        """Get user statistics"""
+        """Get user statistics from the incrementally maintained counters"""
         try:
-            # Get completed requests count
-            completed_requests = await self.get_user_requests(user_id, "completed")
-            
-            # Get active requests count
-            active_requests = await self.get_user_requests(user_id, "pending")
-            
-            # Get transactions count
-            transactions = await self.get_user_transactions(user_id)
-            
-            # Calculate total amount exchanged
-            total_amount = sum(
-                transaction["amount"] for transaction in transactions 
-                if transaction["status"] == "completed"
-            )
-            
-            return {
-                "completed_requests": len(completed_requests),
-                "active_requests": len(active_requests),
-                "total_transactions": len(transactions),
-                "total_amount": total_amount,
-                "success_rate": len(completed_requests) / len(transactions) * 100 if transactions else 0
-            }
+            return await user_stats.get(user_id)
         except Exception as e:
             logger.error(f"Error getting stats for user {user_id}: {e}")
             return {
@@ -223,33 +177,30 @@ class Database:
     async def search_users(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
         """Search users by name or email"""
         try:
-            result = self.get_client().table("profiles").select("*").or_(
-                f"name.ilike.%{query}%,email.ilike.%{query}%"
-            ).limit(limit).execute()
-            
-            return result.data if result.data else []
+            return await self.run("search_profiles", query, limit)
         except Exception as e:
             logger.error(f"Error searching users: {e}")
             return []
 
-    async def delete_user_data(self, user_id: str) -> bool:
-        """Delete all user data (for GDPR compliance)"""
+    async def delete_user_data(self, user_id: str) -> Optional[str]:
+        """Schedule deletion of all user data (for GDPR compliance); returns the erasure job id"""
         try:
-            # Delete user's requests
-            self.get_client().table("requests").delete().eq("user_id", user_id).execute()
-            
-            # Delete user's transactions
-            self.get_client().table("transactions").delete().or_(
-                f"from_user.eq.{user_id},to_user.eq.{user_id}"
-            ).execute()
-            
-            # Delete user profile
-            self.get_client().table("profiles").delete().eq("id", user_id).execute()
-            
-            return True
+            job = await erasure_jobs.schedule(user_id)
+            return job["id"]
         except Exception as e:
-            logger.error(f"Error deleting user data for {user_id}: {e}")
-            return False
+            logger.error(f"Error scheduling data deletion for {user_id}: {e}")
+            return None
+
+# Global database instance, on the storage backend selected by STORAGE_BACKEND
+db = Database()
+
+# Per-user stats counters, fed by the write methods above and the API's write paths
+user_stats = UserStats(count=db.storage.count_user_activity)
+
+def forget_user(user_id: str):
+    """Drop cached state of a user whose data has been erased"""
+    profile_cache.pop(user_id)
+    user_stats.forget(user_id)
 
-# Global database instance
-db = Database()
\ No newline at end of file
+# Background erasure jobs, run by the app lifespan
+erasure_jobs = ErasureJobs(delete_batch=db.storage.delete_user_batch, on_complete=forget_user)
\ No newline at end of file
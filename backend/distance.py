@@ -0,0 +1,156 @@
+import math
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371
+KM_PER_DEGREE_LAT = EARTH_RADIUS_KM * math.pi / 180
+
+
+def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Calculate distance between two points using Haversine formula"""
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = (math.sin(dlat / 2) ** 2 +
+         math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) *
+         math.sin(dlon / 2) ** 2)
+    return EARTH_RADIUS_KM * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def degree_spans(lat: float, radius_km: float) -> Tuple[float, float]:
+    """Latitude and longitude half-widths (degrees) of a box enclosing the circle"""
+    lat_span = radius_km / KM_PER_DEGREE_LAT
+    max_abs_lat = min(abs(lat) + lat_span, 90)
+    cos_lat = math.cos(math.radians(max_abs_lat))
+    if max_abs_lat >= 89.9 or radius_km >= 180 * KM_PER_DEGREE_LAT * cos_lat:
+        # The circle reaches a pole, so every longitude is in range
+        return lat_span, 180.0
+    return lat_span, radius_km / (KM_PER_DEGREE_LAT * cos_lat)
+
+
+def bounding_box(lat: float, lon: float, radius_km: float) -> Tuple[float, float, List[Tuple[float, float]]]:
+    """Return (min_lat, max_lat, longitude ranges) enclosing the circle.
+
+    The longitude ranges are empty when every longitude qualifies and split
+    in two when the box crosses the antimeridian.
+    """
+    lat_span, lon_span = degree_spans(lat, radius_km)
+    min_lat, max_lat = max(lat - lat_span, -90.0), min(lat + lat_span, 90.0)
+    if lon_span >= 180:
+        return min_lat, max_lat, []
+
+    min_lon, max_lon = lon - lon_span, lon + lon_span
+    if min_lon < -180:
+        return min_lat, max_lat, [(min_lon + 360, 180.0), (-180.0, max_lon)]
+    if max_lon > 180:
+        return min_lat, max_lat, [(min_lon, 180.0), (-180.0, max_lon - 360)]
+    return min_lat, max_lat, [(min_lon, max_lon)]
+
+
+def haversine_batch(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Distances in kilometers from one point to arrays of points"""
+    lat1 = math.radians(lat)
+    lat2 = np.radians(lats)
+    dlat = lat2 - lat1
+    dlon = np.radians(lons - lon)
+    a = np.sin(dlat / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def within_radius(
+    lat: float,
+    lon: float,
+    lats: np.ndarray,
+    lons: np.ndarray,
+    radius_km: float,
+    sort: bool = True,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Return (indices, distances) of points within radius_km, closest first.
+
+    A bounding-box test prunes most points before the trigonometric
+    distance is computed for the survivors. With sort=False the matches
+    come back in input order.
+    """
+    lat_span, lon_span = degree_spans(lat, radius_km)
+    # Longitude difference folded into [0, 180] so the antimeridian wraps
+    dlon = np.abs((lons - lon + 180) % 360 - 180)
+    candidates = np.flatnonzero((np.abs(lats - lat) <= lat_span) & (dlon <= lon_span))
+    if candidates.size == 0:
+        return candidates, np.empty(0)
+
+    distances = haversine_batch(lat, lon, lats[candidates], lons[candidates])
+    inside = distances <= radius_km
+    candidates, distances = candidates[inside], distances[inside]
+    if not sort:
+        return candidates, distances
+    order = np.argsort(distances, kind="stable")
+    return candidates[order], distances[order]
+
+
+def coordinate_arrays(rows: Sequence[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Latitude and longitude arrays for a list of rows"""
+    lats = np.fromiter((float(row["latitude"]) for row in rows), dtype=float, count=len(rows))
+    lons = np.fromiter((float(row["longitude"]) for row in rows), dtype=float, count=len(rows))
+    return lats, lons
+
+
+def nearest(
+    lat: float,
+    lon: float,
+    rows: Sequence[Mapping[str, Any]],
+    radius_km: float,
+    limit: Optional[int] = None,
+    after: Optional[Tuple[float, str]] = None,
+    predicate: Optional[Callable[[Mapping[str, Any]], bool]] = None,
+    coordinates: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+) -> Tuple[List[Mapping[str, Any]], List[float]]:
+    """Rows within radius_km ordered by (distance, id), and their distances as a parallel list.
+
+    after is a (distance_km, id) cursor: only rows ordered after it are
+    returned. With a limit, only the rows up to the limit-th smallest
+    distance are partitioned out and sorted, not the whole match set.
+    predicate is only evaluated for rows inside the radius; coordinates
+    are the rows' (lats, lons) arrays when the caller already has them.
+    """
+    if not rows:
+        return [], []
+    lats, lons = coordinate_arrays(rows) if coordinates is None else coordinates
+    indices, distances = within_radius(lat, lon, lats, lons, radius_km, sort=False)
+
+    if predicate is not None and indices.size:
+        keep = np.fromiter((predicate(rows[index]) for index in indices.tolist()), dtype=bool, count=indices.size)
+        indices, distances = indices[keep], distances[keep]
+
+    if after is not None:
+        after_distance, after_id = after
+        keep = distances > after_distance
+        for tie in np.flatnonzero(distances == after_distance).tolist():
+            keep[tie] = str(rows[indices[tie]]["id"]) > after_id
+        indices, distances = indices[keep], distances[keep]
+
+    if limit is not None and limit < distances.size:
+        threshold = np.partition(distances, limit - 1)[limit - 1]
+        selected = distances <= threshold
+        indices, distances = indices[selected], distances[selected]
+
+    ids = np.array([str(rows[index]["id"]) for index in indices.tolist()])
+    order = np.lexsort((ids, distances)) if distances.size else indices
+    if limit is not None:
+        order = order[:limit]
+    indices, distances = indices[order], distances[order]
+    return [rows[index] for index in indices.tolist()], distances.tolist()
+
+
+def nearby_rows(
+    lat: float,
+    lon: float,
+    rows: Sequence[Mapping[str, Any]],
+    radius_km: float,
+    limit: Optional[int] = None,
+    after: Optional[Tuple[float, str]] = None,
+    predicate: Optional[Callable[[Mapping[str, Any]], bool]] = None,
+    coordinates: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+) -> List[Dict[str, Any]]:
+    """Like nearest(), but as response dicts with distance_km set, built once per returned row"""
+    selected, distances = nearest(lat, lon, rows, radius_km, limit, after, predicate, coordinates)
+    return [dict(row, distance_km=distance) for row, distance in zip(selected, distances)]
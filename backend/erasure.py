@@ -0,0 +1,226 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from blocking_io import run_blocking
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ERASURE_DB_PATH = os.getenv("ERASURE_DB_PATH", "erasure_jobs.sqlite3")
+ERASURE_BATCH_SIZE = int(os.getenv("ERASURE_BATCH_SIZE", "500"))
+# Pause between batches so bulk erasures leave room for live traffic
+ERASURE_BATCH_PAUSE_SECONDS = float(os.getenv("ERASURE_BATCH_PAUSE_SECONDS", "0.2"))
+# A running job not checkpointed for this long is presumed orphaned and may be taken over
+ERASURE_LEASE_SECONDS = float(os.getenv("ERASURE_LEASE_SECONDS", "300"))
+
+# Tables in deletion order; the profile goes last so a failed job can still be found by user
+ERASURE_STEPS = ("requests", "transactions", "profiles")
+
+JOB_FIELDS = ("id", "user_id", "status", "step", "deleted", "error", "created_at", "updated_at")
+
+
+class ErasureJobs:
+    """Background, resumable deletion of all of a user's data.
+
+    Each job walks ERASURE_STEPS, deleting rows in batches of at most
+    batch_size ids. Progress is checkpointed to a SQLite table after every
+    batch, so jobs interrupted by a restart or a failure resume where they
+    stopped. Jobs run one at a time with a pause between batches.
+
+    Every worker sharing the table may run jobs. A worker claims a job with
+    a conditional update that records it as owner, and all later status
+    writes only apply while it still owns the running job, so two workers
+    never process the same job or overwrite each other's outcome. A
+    running job whose owner stops checkpointing for lease seconds can be
+    claimed again.
+    """
+
+    def __init__(
+        self,
+        delete_batch: Callable[[str, str, int], int],
+        on_complete: Optional[Callable[[str], None]] = None,
+        path: str = ERASURE_DB_PATH,
+        batch_size: int = ERASURE_BATCH_SIZE,
+        pause: float = ERASURE_BATCH_PAUSE_SECONDS,
+        lease: float = ERASURE_LEASE_SECONDS,
+    ):
+        self.delete_batch = delete_batch
+        self.on_complete = on_complete
+        self.path = path
+        self.batch_size = batch_size
+        self.pause = pause
+        self.lease = lease
+        self.owner = uuid.uuid4().hex
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS erasure_jobs ("
+                "id TEXT PRIMARY KEY, user_id TEXT NOT NULL, status TEXT NOT NULL, "
+                "step INTEGER NOT NULL, deleted INTEGER NOT NULL, error TEXT, "
+                "created_at REAL NOT NULL, updated_at REAL NOT NULL, owner TEXT)"
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(erasure_jobs)")}
+            if "owner" not in columns:
+                # Tables created before jobs had owners
+                self._conn.execute("ALTER TABLE erasure_jobs ADD COLUMN owner TEXT")
+        return self._conn
+
+    def _select(self, where: str, params: tuple) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._connection().execute(
+                f"SELECT {', '.join(JOB_FIELDS)} FROM erasure_jobs WHERE {where} ORDER BY created_at",
+                params,
+            ).fetchall()
+        return [dict(zip(JOB_FIELDS, row)) for row in rows]
+
+    def _claim(self, job: Dict[str, Any]) -> bool:
+        """Take a pending or orphaned job as this worker's; False if another worker has it"""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            cursor = conn.execute(
+                "UPDATE erasure_jobs SET status = 'running', owner = ?, updated_at = ? "
+                "WHERE id = ? AND (status = 'pending' OR (status = 'running' AND updated_at < ?))",
+                (self.owner, now, job["id"], now - self.lease),
+            )
+            conn.commit()
+        if not cursor.rowcount:
+            return False
+        job.update(status="running", updated_at=now)
+        return True
+
+    def _save(self, job: Dict[str, Any]) -> bool:
+        """Write the job's progress and status while this worker owns it; False once it doesn't"""
+        job["updated_at"] = time.time()
+        with self._lock:
+            conn = self._connection()
+            cursor = conn.execute(
+                "UPDATE erasure_jobs SET status = ?, step = ?, deleted = ?, error = ?, updated_at = ? "
+                "WHERE id = ? AND owner = ? AND status = 'running'",
+                (job["status"], job["step"], job["deleted"], job["error"], job["updated_at"], job["id"], self.owner),
+            )
+            conn.commit()
+        return bool(cursor.rowcount)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _schedule(self, user_id: str) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            # One write transaction, so concurrent workers can't both create a job for the user
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    f"SELECT {', '.join(JOB_FIELDS)} FROM erasure_jobs "
+                    "WHERE user_id = ? AND status != 'completed' ORDER BY created_at DESC LIMIT 1",
+                    (user_id,),
+                ).fetchone()
+                if row is not None:
+                    job = dict(zip(JOB_FIELDS, row))
+                    if job["status"] == "failed":
+                        # Retry from the last checkpoint
+                        job.update(status="pending", error=None, updated_at=now)
+                        conn.execute(
+                            "UPDATE erasure_jobs SET status = 'pending', error = NULL, owner = NULL, updated_at = ? "
+                            "WHERE id = ? AND status = 'failed'",
+                            (now, job["id"]),
+                        )
+                else:
+                    job = {
+                        "id": uuid.uuid4().hex, "user_id": user_id, "status": "pending", "step": 0,
+                        "deleted": 0, "error": None, "created_at": now, "updated_at": now
+                    }
+                    conn.execute(
+                        f"INSERT INTO erasure_jobs ({', '.join(JOB_FIELDS)}) VALUES ({', '.join('?' * len(JOB_FIELDS))})",
+                        tuple(job[field] for field in JOB_FIELDS),
+                    )
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        return job
+
+    async def schedule(self, user_id: str) -> Dict[str, Any]:
+        """Queue erasure of a user's data; an unfinished job for the user is reused"""
+        job = await run_blocking(self._schedule, user_id)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        jobs = await run_blocking(self._select, "id = ?", (job_id,))
+        return jobs[0] if jobs else None
+
+    def _delete_batch(self, job: Dict[str, Any]) -> int:
+        """Delete up to batch_size rows of the job's current step; returns the number deleted"""
+        return self.delete_batch(ERASURE_STEPS[job["step"]], job["user_id"], self.batch_size)
+
+    async def _process(self, job: Dict[str, Any]) -> None:
+        if not await run_blocking(self._claim, job):
+            return
+        try:
+            while job["step"] < len(ERASURE_STEPS):
+                deleted = await run_blocking(self._delete_batch, job)
+                if deleted:
+                    job["deleted"] += deleted
+                else:
+                    job["step"] += 1
+                if not await run_blocking(self._save, job):
+                    logger.warning(f"Erasure job {job['id']} was taken over by another worker")
+                    return
+                await asyncio.sleep(self.pause)
+        except Exception as e:
+            logger.error(f"Erasure job {job['id']} for user {job['user_id']} failed at step {job['step']}: {e}")
+            job.update(status="failed", error=str(e))
+            await run_blocking(self._save, job)
+            return
+
+        job["status"] = "completed"
+        if not await run_blocking(self._save, job):
+            logger.warning(f"Erasure job {job['id']} was taken over by another worker before it completed")
+            return
+        if self.on_complete is not None:
+            self.on_complete(job["user_id"])
+        logger.info(f"Erasure job {job['id']} deleted {job['deleted']} rows for user {job['user_id']}")
+
+    async def run(self) -> None:
+        """Work through pending and interrupted jobs until cancelled"""
+        self._wakeup = asyncio.Event()
+        while True:
+            self._wakeup.clear()
+            try:
+                # Pending jobs, plus running ones whose owner stopped checkpointing
+                jobs = await run_blocking(
+                    self._select,
+                    "status = 'pending' OR (status = 'running' AND updated_at < ?)",
+                    (time.time() - self.lease,),
+                )
+                for job in jobs:
+                    await self._process(job)
+            except Exception as e:
+                logger.error(f"Error running erasure jobs: {e}")
+                jobs = []
+            if not jobs:
+                # Wake up at least once per lease to take over orphaned jobs
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.lease)
+                except asyncio.TimeoutError:
+                    pass
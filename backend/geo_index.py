@@ -0,0 +1,217 @@
+import math
+import logging
+from typing import Callable, Collection, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from distance import degree_spans, nearby_rows
+from metrics import observe_nearby
+from records import RequestRecord
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CellKey = Tuple[int, int]
+
+
+class GeoGrid:
+    """Fixed-size latitude/longitude cells covering the globe"""
+
+    def __init__(self, cell_size_deg: float = 0.05):
+        self.cell_size = cell_size_deg
+        self.lat_cells = int(math.ceil(180 / cell_size_deg))
+        self.lon_cells = int(math.ceil(360 / cell_size_deg))
+
+    def cell_for(self, lat: float, lon: float) -> CellKey:
+        """Return the grid cell containing a coordinate"""
+        lat_idx = int((lat + 90) // self.cell_size)
+        lon_idx = int((lon + 180) // self.cell_size) % self.lon_cells
+        return min(max(lat_idx, 0), self.lat_cells - 1), lon_idx
+
+    def cells_in_radius(
+        self,
+        lat: float,
+        lon: float,
+        radius_km: float,
+        occupied: Optional[Collection[CellKey]] = None,
+    ) -> List[CellKey]:
+        """Return every cell that may contain points within radius_km of (lat, lon).
+
+        With occupied given, only those cells are returned, and when the box
+        spans more cells than are occupied they are filtered instead of the
+        box being enumerated.
+        """
+        lat_span, lon_span = degree_spans(lat, radius_km)
+        min_lat_idx = max(int((lat - lat_span + 90) // self.cell_size), 0)
+        max_lat_idx = min(int((lat + lat_span + 90) // self.cell_size), self.lat_cells - 1)
+
+        # Near the poles (or for huge radii) the circle covers every longitude
+        if lon_span >= 180:
+            lon_range = range(self.lon_cells)
+        else:
+            start = int((lon - lon_span + 180) // self.cell_size)
+            end = int((lon + lon_span + 180) // self.cell_size)
+            # Indices outside [0, lon_cells) wrap around the antimeridian
+            lon_range = dict.fromkeys(idx % self.lon_cells for idx in range(start, end + 1))
+
+        if occupied is not None:
+            if len(occupied) < (max_lat_idx - min_lat_idx + 1) * len(lon_range):
+                return [
+                    key for key in occupied
+                    if min_lat_idx <= key[0] <= max_lat_idx and key[1] in lon_range
+                ]
+            return [
+                (lat_idx, lon_idx)
+                for lat_idx in range(min_lat_idx, max_lat_idx + 1)
+                for lon_idx in lon_range
+                if (lat_idx, lon_idx) in occupied
+            ]
+
+        return [
+            (lat_idx, lon_idx)
+            for lat_idx in range(min_lat_idx, max_lat_idx + 1)
+            for lon_idx in lon_range
+        ]
+
+
+class GeoIndex(GeoGrid):
+    """In-memory grid index of pending requests.
+
+    Rows are bucketed into grid cells so a radius query only has to look at
+    the cells overlapping the search circle instead of every pending request.
+    Rows are stored as compact RequestRecords, and each cell lazily keeps
+    coordinate arrays of its records so queries don't rebuild them per poll.
+    """
+
+    def __init__(self, cell_size_deg: float = 0.05):
+        super().__init__(cell_size_deg)
+        self.ready = False
+        self._cells: Dict[CellKey, Dict[str, RequestRecord]] = {}
+        self._row_cells: Dict[str, CellKey] = {}
+        # cell -> (records, latitudes, longitudes), dropped whenever the cell changes
+        self._cell_arrays: Dict[CellKey, Tuple[List[RequestRecord], np.ndarray, np.ndarray]] = {}
+        # Writes seen while a reload snapshot is being fetched
+        self._writes_during_load: Optional[Dict[str, Dict]] = None
+
+    def __len__(self) -> int:
+        return len(self._row_cells)
+
+    def upsert(self, row: Dict) -> None:
+        """Add or move a request; rows that are no longer pending are dropped"""
+        request_id = str(row.get("id"))
+        if self._writes_during_load is not None:
+            self._writes_during_load[request_id] = row
+        self.remove(request_id)
+        if row.get("status") != "pending":
+            return
+        try:
+            record = row if isinstance(row, RequestRecord) else RequestRecord.from_row(row)
+            key = self.cell_for(record.latitude, record.longitude)
+        except (KeyError, TypeError, ValueError):
+            logger.warning(f"Skipping request {request_id} without valid coordinates")
+            return
+        self._cells.setdefault(key, {})[request_id] = record
+        self._row_cells[request_id] = key
+        self._cell_arrays.pop(key, None)
+
+    def get(self, request_id: str) -> Optional[RequestRecord]:
+        """Return an indexed pending request by id"""
+        key = self._row_cells.get(str(request_id))
+        return None if key is None else self._cells[key].get(str(request_id))
+
+    def records_of_user(self, user_id: str) -> List[RequestRecord]:
+        """Indexed requests of one user; scans the whole index, so only for rare operations such as erasure"""
+        return [record for cell in self._cells.values() for record in cell.values() if record.user_id == user_id]
+
+    def remove(self, request_id: str) -> None:
+        """Drop a request from the index if present"""
+        key = self._row_cells.pop(str(request_id), None)
+        if key is None:
+            return
+        self._cell_arrays.pop(key, None)
+        cell = self._cells.get(key)
+        if cell is not None:
+            cell.pop(str(request_id), None)
+            if not cell:
+                del self._cells[key]
+
+    def begin_load(self) -> None:
+        """Start recording writes so a later load() doesn't lose them"""
+        self._writes_during_load = {}
+
+    def load(self, rows: Iterable[Dict]) -> List[Tuple[str, Dict]]:
+        """Replace the whole index with the given pending rows.
+
+        Writes recorded since begin_load() are replayed on top, since the
+        snapshot may predate them. Returns the ("insert" | "update" |
+        "delete", row) changes relative to the previous contents.
+        """
+        writes = self._writes_during_load or {}
+        self._writes_during_load = None
+        old_rows = {
+            request_id: self._cells[key][request_id]
+            for request_id, key in self._row_cells.items()
+        }
+        self._cells = {}
+        self._row_cells = {}
+        self._cell_arrays = {}
+        for row in rows:
+            self.upsert(row)
+        for row in writes.values():
+            self.upsert(row)
+        self.ready = True
+        logger.info(f"Geo index loaded with {len(self)} pending requests")
+
+        changes = []
+        for request_id, old_row in old_rows.items():
+            if request_id not in self._row_cells:
+                changes.append(("delete", old_row))
+        for request_id, key in self._row_cells.items():
+            row = self._cells[key][request_id]
+            old_row = old_rows.get(request_id)
+            if old_row is None:
+                changes.append(("insert", row))
+            elif old_row != row:
+                changes.append(("update", row))
+        return changes
+
+    def _arrays(self, key: CellKey) -> Tuple[List[RequestRecord], np.ndarray, np.ndarray]:
+        arrays = self._cell_arrays.get(key)
+        if arrays is None:
+            records = list(self._cells[key].values())
+            lats = np.fromiter((record.latitude for record in records), dtype=float, count=len(records))
+            lons = np.fromiter((record.longitude for record in records), dtype=float, count=len(records))
+            arrays = self._cell_arrays[key] = (records, lats, lons)
+        return arrays
+
+    def candidates(self, lat: float, lon: float, radius_km: float) -> Tuple[List[RequestRecord], np.ndarray, np.ndarray]:
+        """Return records from the cells overlapping the search circle, with their coordinate arrays"""
+        keys = self.cells_in_radius(lat, lon, radius_km, occupied=self._cells)
+        if not keys:
+            return [], np.empty(0), np.empty(0)
+        parts = [self._arrays(key) for key in keys]
+        records = [record for part in parts for record in part[0]]
+        return records, np.concatenate([part[1] for part in parts]), np.concatenate([part[2] for part in parts])
+
+    def query(
+        self,
+        lat: float,
+        lon: float,
+        radius_km: float,
+        predicate: Optional[Callable[[RequestRecord], bool]] = None,
+        limit: Optional[int] = None,
+        after: Optional[Tuple[float, str]] = None,
+    ) -> List[Dict]:
+        """Return rows within radius_km sorted by distance, as dicts with distance_km set"""
+        records, lats, lons = self.candidates(lat, lon, radius_km)
+        rows = nearby_rows(
+            lat, lon, records, radius_km, limit=limit, after=after,
+            predicate=predicate, coordinates=(lats, lons)
+        )
+        observe_nearby("index", len(records), len(rows))
+        return rows
+
+
+# Global index of pending requests
+request_index = GeoIndex()
@@ -0,0 +1,215 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from blocking_io import run_blocking
+from cache import SingleFlight, TTLCache
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Geohash length used as the key; 7 characters is a cell of about 150 m
+GEOCODE_CACHE_PRECISION = int(os.getenv("GEOCODE_CACHE_PRECISION", "7"))
+GEOCODE_CACHE_PATH = os.getenv("GEOCODE_CACHE_PATH", "geocode_cache.sqlite3")
+GEOCODE_CACHE_SIZE = int(os.getenv("GEOCODE_CACHE_SIZE", "50000"))
+GEOCODE_CACHE_TTL_SECONDS = float(os.getenv("GEOCODE_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+GEOCODE_WARM_CONCURRENCY = int(os.getenv("GEOCODE_WARM_CONCURRENCY", "4"))
+# Cells waiting for a background lookup; further misses are dropped until it drains
+GEOCODE_WARM_QUEUE_SIZE = int(os.getenv("GEOCODE_WARM_QUEUE_SIZE", "1000"))
+# Cells GraphHopper had no address for aren't asked about again for this long
+GEOCODE_MISS_TTL_SECONDS = float(os.getenv("GEOCODE_MISS_TTL_SECONDS", "600"))
+
+_GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+Fetcher = Callable[[float, float], Awaitable[Optional[str]]]
+
+
+def encode_geohash(lat: float, lon: float, precision: int = GEOCODE_CACHE_PRECISION) -> str:
+    """Standard base32 geohash of a coordinate"""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits, bit_count, even = 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits <<= 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_GEOHASH_ALPHABET[bits])
+            bits, bit_count = 0, 0
+    return "".join(chars)
+
+
+class GeocodeCache:
+    """Two-tier reverse-geocode cache keyed by geohash.
+
+    An in-memory LRU sits in front of a SQLite table, so addresses survive
+    restarts and are shared by workers on the same host.
+    """
+
+    def __init__(
+        self,
+        path: str = GEOCODE_CACHE_PATH,
+        precision: int = GEOCODE_CACHE_PRECISION,
+        maxsize: int = GEOCODE_CACHE_SIZE,
+        ttl: float = GEOCODE_CACHE_TTL_SECONDS,
+    ):
+        self.path = path
+        self.precision = precision
+        self.ttl = ttl
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.unresolved = TTLCache(maxsize=maxsize, ttl=GEOCODE_MISS_TTL_SECONDS)
+        self.flights = SingleFlight()
+        self.disk_hits = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._queued: Dict[str, Tuple[float, float]] = {}
+        self._warm_task: Optional[asyncio.Task] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS addresses ("
+                "geohash TEXT PRIMARY KEY, address TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+        return self._conn
+
+    def _read_disk(self, geohash: str) -> Optional[str]:
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT address FROM addresses WHERE geohash = ? AND updated_at > ?",
+                (geohash, time.time() - self.ttl),
+            ).fetchone()
+        return row[0] if row else None
+
+    def _read_disk_many(self, geohashes: List[str]) -> Dict[str, str]:
+        found = {}
+        with self._lock:
+            conn = self._connection()
+            for start in range(0, len(geohashes), 500):
+                chunk = geohashes[start:start + 500]
+                found.update(conn.execute(
+                    f"SELECT geohash, address FROM addresses WHERE updated_at > ? "
+                    f"AND geohash IN ({', '.join('?' * len(chunk))})",
+                    (time.time() - self.ttl, *chunk),
+                ).fetchall())
+        return found
+
+    def _write_disk(self, geohash: str, address: str) -> None:
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO addresses (geohash, address, updated_at) VALUES (?, ?, ?)",
+                (geohash, address, time.time()),
+            )
+            conn.commit()
+
+    def close(self) -> None:
+        if self._warm_task is not None:
+            self._warm_task.cancel()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    async def lookup_many(self, coordinates: List[Tuple[float, float]], fetch: Fetcher) -> List[Optional[str]]:
+        """Addresses from the memory tier, then the disk tier in one query.
+
+        Cells in neither tier come back as None and are queued for a
+        background lookup, so list responses never wait on GraphHopper.
+        """
+        geohashes = [encode_geohash(lat, lon, self.precision) for lat, lon in coordinates]
+        addresses = [self.memory.get(geohash, count=False) for geohash in geohashes]
+        missing = {
+            geohash: coord for geohash, coord, address in zip(geohashes, coordinates, addresses) if address is None
+        }
+        if not missing:
+            return addresses
+
+        found = await run_blocking(self._read_disk_many, list(missing))
+        for geohash, address in found.items():
+            self.memory.set(geohash, address)
+            del missing[geohash]
+        self.disk_hits += len(found)
+        self.schedule(missing.values(), fetch)
+        return [address if address is not None else found.get(geohash) for geohash, address in zip(geohashes, addresses)]
+
+    def schedule(self, coordinates: Iterable[Tuple[float, float]], fetch: Fetcher) -> None:
+        """Queue coordinates for a background lookup, skipping cached and recently unresolved cells"""
+        for lat, lon in coordinates:
+            if len(self._queued) >= GEOCODE_WARM_QUEUE_SIZE:
+                break
+            geohash = encode_geohash(lat, lon, self.precision)
+            if self.memory.get(geohash, count=False) is None and not self.unresolved.get(geohash, count=False):
+                self._queued.setdefault(geohash, (lat, lon))
+        if self._queued and (self._warm_task is None or self._warm_task.done()):
+            self._warm_task = asyncio.get_running_loop().create_task(self._drain(fetch))
+
+    async def _drain(self, fetch: Fetcher) -> None:
+        while self._queued:
+            batch = list(self._queued.values())
+            self._queued.clear()
+            await self.warm(batch, fetch)
+
+    async def get(self, lat: float, lon: float, fetch: Fetcher) -> Optional[str]:
+        """Return the address for a coordinate, fetching it once on a miss"""
+        geohash = encode_geohash(lat, lon, self.precision)
+        address = self.memory.get(geohash)
+        if address is not None:
+            return address
+
+        async def load():
+            cached = await run_blocking(self._read_disk, geohash)
+            if cached is not None:
+                self.disk_hits += 1
+                self.memory.set(geohash, cached)
+                return cached
+            fetched = await fetch(lat, lon)
+            if fetched:
+                self.memory.set(geohash, fetched)
+                await run_blocking(self._write_disk, geohash, fetched)
+            else:
+                self.unresolved.set(geohash, True)
+            return fetched
+
+        return await self.flights.run(geohash, load)
+
+    async def warm(self, coordinates: Iterable[Tuple[float, float]], fetch: Fetcher) -> int:
+        """Prefetch addresses for many coordinates; returns the number of cells warmed"""
+        cells = {}
+        for lat, lon in coordinates:
+            cells.setdefault(encode_geohash(lat, lon, self.precision), (lat, lon))
+        missing = [coord for geohash, coord in cells.items() if self.memory.get(geohash, count=False) is None]
+
+        semaphore = asyncio.Semaphore(GEOCODE_WARM_CONCURRENCY)
+
+        async def warm_one(lat: float, lon: float):
+            async with semaphore:
+                try:
+                    await self.get(lat, lon, fetch)
+                except Exception as e:
+                    self.unresolved.set(encode_geohash(lat, lon, self.precision), True)
+                    logger.warning(f"Failed to warm address for {lat}, {lon}: {e}")
+
+        await asyncio.gather(*(warm_one(lat, lon) for lat, lon in missing))
+        return len(missing)
+
+    def stats(self):
+        return {**self.memory.stats(), "disk_hits": self.disk_hits, "queued": len(self._queued)}
+
+
+# Global reverse-geocode cache
+geocode_cache = GeocodeCache()
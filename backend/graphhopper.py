@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+
+from metrics import upstream_timer
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+GRAPHHOPPER_API_KEY = os.getenv("GRAPHHOPPER_API_KEY")
+# Point at a local stub server for testing
+GRAPHHOPPER_BASE_URL = os.getenv("GRAPHHOPPER_BASE_URL", "https://graphhopper.com/api/1")
+GRAPHHOPPER_TIMEOUT_SECONDS = float(os.getenv("GRAPHHOPPER_TIMEOUT_SECONDS", "5"))
+GRAPHHOPPER_MAX_CONNECTIONS = int(os.getenv("GRAPHHOPPER_MAX_CONNECTIONS", "20"))
+GRAPHHOPPER_MAX_CONCURRENCY = int(os.getenv("GRAPHHOPPER_MAX_CONCURRENCY", "20"))
+# Send a duplicate request when the first hasn't answered after this long; 0 disables
+GRAPHHOPPER_HEDGE_AFTER_SECONDS = float(os.getenv("GRAPHHOPPER_HEDGE_AFTER_SECONDS", "0"))
+
+Params = List[Tuple[str, Any]]
+
+
+class GraphHopperError(Exception):
+    """Raised when GraphHopper fails, times out or answers with an error status"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class GraphHopperClient:
+    """Shared, pooled HTTP client for the GraphHopper API.
+
+    One keep-alive connection pool is reused for every call. Each call is
+    bounded by a deadline and a concurrency limit, and can optionally be
+    hedged with a second request to cut tail latency.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = GRAPHHOPPER_API_KEY,
+        base_url: str = GRAPHHOPPER_BASE_URL,
+        timeout: float = GRAPHHOPPER_TIMEOUT_SECONDS,
+        max_connections: int = GRAPHHOPPER_MAX_CONNECTIONS,
+        max_concurrency: int = GRAPHHOPPER_MAX_CONCURRENCY,
+        hedge_after: float = GRAPHHOPPER_HEDGE_AFTER_SECONDS,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.hedge_after = hedge_after
+        self.transport = transport
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def start(self) -> None:
+        """Open the connection pool"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+                transport=self.transport,
+            )
+
+    async def close(self) -> None:
+        """Close the connection pool"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _send(self, method: str, path: str, params: Params, json: Any) -> httpx.Response:
+        with upstream_timer("graphhopper", path):
+            return await self._client.request(method, path, params=params + [("key", self.api_key)], json=json)
+
+    async def _hedged(self, method: str, path: str, params: Params, json: Any) -> httpx.Response:
+        """Return the first successful answer of the original and a hedge request"""
+        first = asyncio.ensure_future(self._send(method, path, params, json))
+        pending = {first}
+        error: Optional[BaseException] = None
+        # Cancel whatever is still in flight on every exit, including the caller being cancelled
+        try:
+            if self.hedge_after <= 0:
+                return await first
+
+            done, pending = await asyncio.wait(pending, timeout=self.hedge_after)
+            if done:
+                return first.result()
+
+            pending.add(asyncio.ensure_future(self._send(method, path, params, json)))
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        params: Sequence[Tuple[str, Any]] = (),
+        json: Any = None,
+    ) -> Dict[str, Any]:
+        """Call the API and return the decoded JSON body"""
+        if self._client is None:
+            await self.start()
+        try:
+            async with self._semaphore:
+                response = await asyncio.wait_for(
+                    self._hedged(method, path, list(params), json), self.timeout
+                )
+        except asyncio.TimeoutError:
+            raise GraphHopperError(504, "GraphHopper request timed out")
+        except httpx.HTTPError as e:
+            raise GraphHopperError(502, f"GraphHopper request failed: {e}")
+
+        if response.status_code != 200:
+            raise GraphHopperError(response.status_code, f"GraphHopper returned {response.status_code}")
+        try:
+            data = response.json()
+        except ValueError:
+            raise GraphHopperError(502, "GraphHopper returned a body that isn't JSON")
+        if not isinstance(data, dict):
+            raise GraphHopperError(502, "GraphHopper returned an unexpected body")
+        return data
+
+    async def route(self, start_lat: float, start_lng: float, end_lat: float, end_lng: float) -> Dict[str, Any]:
+        """Walking route between two points"""
+        data = await self.request("GET", "/route", [
+            ("point", f"{start_lat},{start_lng}"),
+            ("point", f"{end_lat},{end_lng}"),
+            ("vehicle", "foot"),
+        ])
+        paths = data.get("paths")
+        if not isinstance(paths, list) or not paths or not isinstance(paths[0], dict):
+            raise GraphHopperError(502, "GraphHopper returned a route without paths")
+        return data
+
+    async def matrix(
+        self,
+        from_points: Sequence[Tuple[float, float]],
+        to_points: Sequence[Tuple[float, float]],
+    ) -> Dict[str, Any]:
+        """Walking distance (m) and time (s) between every from/to pair, as (lat, lng) points"""
+        return await self.request("POST", "/matrix", json={
+            # The Matrix API takes [lng, lat] pairs
+            "from_points": [[lng, lat] for lat, lng in from_points],
+            "to_points": [[lng, lat] for lat, lng in to_points],
+            "out_arrays": ["distances", "times"],
+            "profile": "foot",
+        })
+
+    async def reverse_geocode(self, lat: float, lng: float) -> Dict[str, Any]:
+        """Reverse geocode a coordinate"""
+        return await self.request("GET", "/geocode", [
+            ("point", f"{lat},{lng}"),
+            ("reverse", "true"),
+        ])
+
+
+# Global GraphHopper client, opened and closed by the app lifespan
+graphhopper = GraphHopperClient()
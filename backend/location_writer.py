@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from blocking_io import run_blocking
+from cache import TTLCache
+from distance import calculate_distance
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# A ping is stored only if the user moved at least this far, or the last
+# stored position is at least this old
+LOCATION_MIN_DISTANCE_M = float(os.getenv("LOCATION_MIN_DISTANCE_M", "25"))
+LOCATION_MIN_INTERVAL_SECONDS = float(os.getenv("LOCATION_MIN_INTERVAL_SECONDS", "60"))
+LOCATION_FLUSH_SECONDS = float(os.getenv("LOCATION_FLUSH_SECONDS", "5"))
+LOCATION_FLUSH_BATCH_SIZE = int(os.getenv("LOCATION_FLUSH_BATCH_SIZE", "500"))
+# Flush buffered positions when the app stops; when false they are dropped
+LOCATION_FLUSH_ON_SHUTDOWN = os.getenv("LOCATION_FLUSH_ON_SHUTDOWN", "true").lower() == "true"
+
+
+class LocationWriter:
+    """Write-behind buffer for user location pings.
+
+    Pings that barely move the user are dropped. Accepted positions are
+    visible immediately through the profile cache and written to the
+    database in batches on an interval; a newer ping for the same user
+    replaces a buffered one instead of adding a write. Only existing
+    profiles are updated, never created.
+    """
+
+    def __init__(
+        self,
+        update: Callable[[List[Dict[str, Any]]], None],
+        profiles: TTLCache,
+        min_distance_m: float = LOCATION_MIN_DISTANCE_M,
+        min_interval: float = LOCATION_MIN_INTERVAL_SECONDS,
+        batch_size: int = LOCATION_FLUSH_BATCH_SIZE,
+    ):
+        self.update = update
+        self.profiles = profiles
+        self.min_distance_m = min_distance_m
+        self.min_interval = min_interval
+        self.batch_size = batch_size
+        self.accepted = 0
+        self.dropped = 0
+        self.flushed = 0
+        self.failed_flushes = 0
+        # user id -> (latitude, longitude, monotonic time) of the last accepted ping,
+        # kept while it can still cause a ping to be dropped
+        self._last: Dict[str, Tuple[float, float, float]] = {}
+        # user id -> row waiting to be written
+        self._pending: Dict[str, Dict[str, Any]] = {}
+
+    def submit(self, user_id: str, latitude: float, longitude: float, profile: Optional[Dict[str, Any]] = None) -> bool:
+        """Buffer a ping; returns False when it was dropped as redundant"""
+        now = time.monotonic()
+        last = self._last.get(user_id)
+        if last is not None and now - last[2] < self.min_interval:
+            moved_m = calculate_distance(last[0], last[1], latitude, longitude) * 1000
+            if moved_m < self.min_distance_m:
+                self.dropped += 1
+                return False
+
+        self._last[user_id] = (latitude, longitude, now)
+        row = {
+            "id": user_id,
+            "latitude": latitude,
+            "longitude": longitude,
+            "updated_at": datetime.now(timezone.utc).isoformat()
+        }
+        self._pending[user_id] = row
+        if profile is not None:
+            self.profiles.set(user_id, {**profile, **row})
+        self.accepted += 1
+        return True
+
+    def apply(self, user_id: str, profile: Dict[str, Any]) -> Dict[str, Any]:
+        """Overlay a buffered position on a profile read from the database"""
+        row = self._pending.get(user_id)
+        return {**profile, **row} if row else profile
+
+    def _evict(self) -> None:
+        """Forget last positions that are flushed and too old to drop another ping"""
+        cutoff = time.monotonic() - self.min_interval
+        for user_id in [user_id for user_id, last in self._last.items() if last[2] <= cutoff]:
+            if user_id not in self._pending:
+                del self._last[user_id]
+
+    async def flush(self) -> int:
+        """Write all buffered positions; returns the number written"""
+        pending, self._pending = self._pending, {}
+        rows = list(pending.values())
+        written = 0
+        for start in range(0, len(rows), self.batch_size):
+            batch = rows[start:start + self.batch_size]
+            try:
+                await run_blocking(self.update, batch)
+                written += len(batch)
+            except Exception as e:
+                self.failed_flushes += 1
+                logger.error(f"Error flushing {len(batch)} locations: {e}")
+                # Re-queue unless a newer ping arrived meanwhile
+                for row in batch:
+                    self._pending.setdefault(row["id"], row)
+        self.flushed += written
+        self._evict()
+        return written
+
+    async def run(self, interval: float = LOCATION_FLUSH_SECONDS) -> None:
+        """Flush on an interval until cancelled"""
+        while True:
+            await asyncio.sleep(interval)
+            if self._pending:
+                await self.flush()
+            else:
+                self._evict()
+
+    async def shutdown(self, flush: bool = LOCATION_FLUSH_ON_SHUTDOWN) -> None:
+        if flush:
+            await self.flush()
+        elif self._pending:
+            logger.warning(f"Dropping {len(self._pending)} buffered locations on shutdown")
+            self._pending.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._pending),
+            "tracked": len(self._last),
+            "accepted": self.accepted,
+            "dropped": self.dropped,
+            "flushed": self.flushed,
+            "failed_flushes": self.failed_flushes
+        }
@@ -1,25 +1,73 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Header
+from fastapi import FastAPI, Depends, HTTPException, status, Header, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
-from numpy import sin
-from supabase import create_client, Client
-from typing import List, Optional, Dict, Any
+from fastapi.responses import Response, StreamingResponse
+from typing import List, Optional, Dict, Any, Tuple
 import os
 from pydantic import BaseModel
-from datetime import datetime, timedelta
-import math
-import requests
+from datetime import datetime, timedelta, timezone
+from contextlib import asynccontextmanager
+import asyncio
+import base64
+import hmac
+import time
 import json
 from dotenv import load_dotenv
 import traceback
 import logging
 
+import blocking_io
+from auth_cache import AuthUnavailable, TokenVerifier
+from backends import SupabaseStorage
+from blocking_io import run_blocking
+from changelog import request_changes, tombstone
+from claims import request_claims
+from database import db, erasure_jobs, forget_user, profile_cache, user_stats
+from distance import calculate_distance, nearby_rows
+from geo_index import request_index
+from geocode_cache import geocode_cache
+from graphhopper import GraphHopperError, graphhopper
+from location_writer import LocationWriter
+from metrics import (
+    METRICS_TOKEN, PROMETHEUS_CONTENT_TYPE, MetricsMiddleware, monitor_event_loop, observe_nearby, registry, timed
+)
+from matching import matching_engine
+from profiling import ProfilingMiddleware, admin_token_valid, phase, profile_store
+from request_stream import request_broker
+from route_cache import eta_matrix, route_cache
+from serialization import VARY, list_response, representation_etag
+
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-app = FastAPI()
+# How often the in-memory request index is rebuilt from the database, to pick
+# up writes made by other worker processes
+GEO_INDEX_REFRESH_SECONDS = float(os.getenv("GEO_INDEX_REFRESH_SECONDS", "60"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await graphhopper.start()
+    refresh_task = asyncio.create_task(refresh_request_index())
+    location_task = asyncio.create_task(location_writer.run())
+    stats_task = asyncio.create_task(user_stats.run())
+    erasure_task = asyncio.create_task(erasure_jobs.run())
+    lag_task = asyncio.create_task(monitor_event_loop())
+    yield
+    lag_task.cancel()
+    erasure_task.cancel()
+    refresh_task.cancel()
+    location_task.cancel()
+    stats_task.cancel()
+    await location_writer.shutdown()
+    await graphhopper.close()
+    geocode_cache.close()
+    erasure_jobs.close()
+    db.close()
+    blocking_io.shutdown()
+
+app = FastAPI(lifespan=lifespan)
 
 # Allow all origins for development
 origins = [
@@ -34,13 +82,42 @@ app.add_middleware(
     allow_headers=["*"],
     expose_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(ProfilingMiddleware)
 
-supabase: Client = create_client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_KEY")
+# Tokens are verified by Supabase Auth whichever backend stores the data
+auth_backend = db.storage if isinstance(db.storage, SupabaseStorage) else SupabaseStorage()
+token_verifier = TokenVerifier(fetch_remote=timed(
+    "supabase", "auth.get_user", lambda token: auth_backend.get_client().auth.get_user(token)
+))
+location_writer = LocationWriter(
+    update=timed(db.storage.name, "update_locations", db.storage.update_locations), profiles=profile_cache
 )
 
-GRAPHHOPPER_API_KEY = os.getenv("GRAPHHOPPER_API_KEY")
+# stats() of the in-process caches and components, served by /api/cache/stats and /metrics
+COMPONENT_STATS = {
+    "route": route_cache.stats,
+    "profile": profile_cache.stats,
+    "auth": token_verifier.users.stats,
+    "geocode": geocode_cache.stats,
+    "eta": eta_matrix.stats,
+    "location": location_writer.stats,
+    "claims": request_claims.stats,
+    "matching": matching_engine.stats,
+    "user_stats": user_stats.stats,
+}
+for name, stats in COMPONENT_STATS.items():
+    registry.add_stats(name, stats)
+
+STREAM_HEARTBEAT_SECONDS = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "15"))
+LONG_POLL_MAX_SECONDS = float(os.getenv("LONG_POLL_MAX_SECONDS", "30"))
+MATRIX_MAX_DESTINATIONS = int(os.getenv("MATRIX_MAX_DESTINATIONS", "100"))
+# Top-k mode doubles the search radius until k requests are found or this is reached
+TOPK_MAX_RADIUS_KM = float(os.getenv("TOPK_MAX_RADIUS_KM", "50"))
+# Upper bound on the search radius a client may ask for
+MAX_RADIUS_KM = float(os.getenv("MAX_RADIUS_KM", "50"))
+# Prefetch addresses for all pending requests after each index refresh
+GEOCODE_WARM_PENDING = os.getenv("GEOCODE_WARM_PENDING", "false").lower() == "true"
 
 # Models
 class LocationUpdate(BaseModel):
@@ -62,10 +139,21 @@ class RequestResponse(BaseModel):
     created_at: datetime
     status: str
     distance_km: Optional[float] = None
+    address: Optional[str] = None
+    eta_seconds: Optional[float] = None
+    match_id: Optional[str] = None  # Proposed counterpart, set on create
 
     class Config:
         orm_mode = True
 
+# List endpoints encode these fields directly instead of re-validating through RequestResponse
+REQUEST_RESPONSE_FIELDS = tuple(RequestResponse.__annotations__)
+
+class MatrixRequest(BaseModel):
+    request_ids: List[str]
+    latitude: Optional[float] = None  # Defaults to the caller's saved location
+    longitude: Optional[float] = None
+
 class UserResponse(BaseModel):
     id: str
     email: str
@@ -91,13 +179,14 @@ async def get_current_user(authorization: Optional[str] = Header(None)):
         else:
             token = authorization
         
-        user = supabase.auth.get_user(token)
-        if not user or not user.user:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid authentication credentials"
-            )
-        return user.user
+        # Warm tokens are served from the verification cache
+        with phase("auth"):
+            return await token_verifier.authenticate(token)
+    except AuthUnavailable:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Authentication service unavailable, please retry"
+        )
     except Exception as e:
         logger.error(f"Authentication error: {e}")
         raise HTTPException(
@@ -107,37 +196,243 @@ async def get_current_user(authorization: Optional[str] = Header(None)):
         )
 
 # Helper functions
-def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    R = 6371 
-    dlat = math.radians(lat2 - lat1)
-    dlon = math.radians(lon2 - lon1)
-    a = math.sin(dlat/2) * math.sin(dlat/2) + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon/2) * sin(dlon/2)
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    return R * c
-
-def get_address_from_coordinates(lat: float, lng: float) -> str:
+def parse_timestamp(value: Any) -> Optional[datetime]:
+    """Parse an ISO timestamp into an aware UTC datetime"""
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        try:
+            parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+async def get_profile(user_id: str) -> Optional[Dict[str, Any]]:
+    """Get a user's profile, served from the profile cache when warm"""
+    profile = profile_cache.get(user_id)
+    if profile is not None:
+        return profile
+    row = await db.run("get_profile", user_id)
+    if not row:
+        return None
+    # The database may not have the latest buffered location yet
+    profile = location_writer.apply(user_id, row)
+    profile_cache.set(user_id, profile)
+    return profile
+
+async def fetch_pending_in_radius(
+    lat: float,
+    lon: float,
+    radius_km: float,
+    exclude_user_id: str,
+    since: Optional[datetime] = None,
+    limit: Optional[int] = None,
+    after: Optional[Tuple[float, str]] = None
+) -> List[Dict[str, Any]]:
+    """Fetch pending requests of other users within radius_km, closest first"""
+    # Only rows inside the bounding box are transferred
+    candidates = await db.run("pending_requests_near", lat, lon, radius_km, exclude_user_id, since)
+    
+    # Exact circle check on the small boxed set
+    rows = nearby_rows(lat, lon, candidates, radius_km, limit=limit, after=after)
+    observe_nearby("database", len(candidates), len(rows))
+    return rows
+
+async def find_pending_in_radius(
+    lat: float,
+    lon: float,
+    radius_km: float,
+    exclude_user_id: str,
+    since: Optional[datetime] = None,
+    limit: Optional[int] = None,
+    after: Optional[Tuple[float, str]] = None
+) -> List[Dict[str, Any]]:
+    """Pending requests of other users within radius_km, from the index once it's loaded"""
+    if not request_index.ready:
+        return await fetch_pending_in_radius(lat, lon, radius_km, exclude_user_id, since, limit, after)
+    
+    if since is not None and since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    # Only the index cells overlapping the search circle are scanned
+    return request_index.query(
+        lat, lon, radius_km,
+        predicate=lambda req: req.get("user_id") != exclude_user_id and (
+            since is None or (parse_timestamp(req.get("created_at")) or since) >= since
+        ),
+        limit=limit,
+        after=after
+    )
+
+async def find_nearest_pending(
+    lat: float,
+    lon: float,
+    k: int,
+    radius_km: float,
+    exclude_user_id: str,
+    since: Optional[datetime] = None,
+    after: Optional[Tuple[float, str]] = None
+) -> List[Dict[str, Any]]:
+    """The k closest pending requests, widening the radius until k are found"""
+    while True:
+        rows = await find_pending_in_radius(lat, lon, radius_km, exclude_user_id, since, k, after)
+        if len(rows) >= k or radius_km >= TOPK_MAX_RADIUS_KM:
+            return rows
+        radius_km = min(radius_km * 2, TOPK_MAX_RADIUS_KM)
+
+def encode_cursor(row: Dict[str, Any]) -> str:
+    """Opaque (distance, id) cursor pointing just past a row"""
+    raw = json.dumps([row["distance_km"], str(row["id"])])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[float, str]]:
+    if not cursor:
+        return None
     try:
-        response = requests.get(
-            f"https://graphhopper.com/api/1/geocode?point={lat},{lng}&reverse=true&key={GRAPHHOPPER_API_KEY}"
-        )
-        if response.status_code == 200:
-            data = response.json()
-            if data.get('hits') and len(data['hits']) > 0:
-                hit = data['hits'][0]
-                address = hit.get('name', '')
-                if hit.get('city'):
-                    address += f", {hit['city']}"
-                if hit.get('country'):
-                    address += f", {hit['country']}"
-                return address
-        return f"Location: {lat}, {lng}"
-    except Exception:
-        return f"Location: {lat}, {lng}"
+        distance_km, request_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(distance_km), str(request_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def set_next_cursor(response: Response, rows: List[Dict[str, Any]], limit: Optional[int]):
+    """Expose a cursor for the next page when the page came back full"""
+    if limit and len(rows) >= limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(rows[-1])
+
+def publish_request_change(event: str, row: Dict[str, Any]):
+    """Apply a request write to the index and change log and push it to subscribers"""
+    if row.get("status") != "pending":
+        op = "delete"
+    elif request_index.get(str(row.get("id"))) is not None:
+        op = "update"
+    else:
+        op = "insert"
+    request_index.upsert(row)
+    matching_engine.upsert(row)
+    user_stats.request_changed(row, created=event == "created")
+    seq = request_changes.append(op, row)
+    request_broker.publish(event, row, seq)
+
+def record_index_changes(changes: List[Tuple[str, Dict[str, Any]]]):
+    """Log changes found by an index refresh and bump their cells' versions"""
+    cells = set()
+    for op, row in changes:
+        if op == "delete":
+            matching_engine.remove(str(row.get("id")))
+        request_changes.append(op, row)
+        cells.add(request_broker.grid.cell_for(float(row["latitude"]), float(row["longitude"])))
+    request_broker.touch(cells)
+
+def withdraw_user_requests(user_id: str):
+    """Take an erased user's requests out of the index, matching engine and change log.
+
+    Each removal is published as a tombstone, so area versions move on and
+    stream and change-log clients drop the rows.
+    """
+    request_changes.redact(user_id)
+    for record in request_index.records_of_user(user_id):
+        publish_request_change("deleted", tombstone(record))
+
+def forget_erased_user(user_id: str):
+    withdraw_user_requests(user_id)
+    forget_user(user_id)
+
+# Erasure also has to clear the in-memory views this module owns
+erasure_jobs.on_complete = forget_erased_user
+
+async def refresh_request_index():
+    """Periodically rebuild the pending request index from the database"""
+    warm_task = None
+    while True:
+        try:
+            # The first load is the baseline, not a change
+            was_ready = request_index.ready
+            request_index.begin_load()
+            rows = await db.run("pending_requests")
+            changes = request_index.load(rows)
+            for op, row in changes:
+                if op != "delete":
+                    matching_engine.upsert(row)
+            if was_ready:
+                # Picks up writes made by other workers
+                record_index_changes(changes)
+            if GEOCODE_WARM_PENDING and (warm_task is None or warm_task.done()):
+                warm_task = asyncio.create_task(geocode_cache.warm(
+                    [(float(row["latitude"]), float(row["longitude"])) for row in rows],
+                    geocode_request_cell
+                ))
+        except Exception as e:
+            logger.error(f"Error refreshing request index: {e}")
+        await asyncio.sleep(GEO_INDEX_REFRESH_SECONDS)
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header covers the given ETag"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in candidates or "*" in candidates
+
+async def check_area_unchanged(
+    request: Request,
+    response: Response,
+    lat: float,
+    lon: float,
+    radius_km: float,
+    wait: float,
+    *params: Any
+) -> Optional[Response]:
+    """Return a 304 response when the caller's area is unchanged since their ETag.
+
+    With wait > 0 an unchanged area is held open until one of its cells
+    changes or the wait expires. The current ETag is set on response.
+    """
+    cells = request_broker.grid.cells_in_radius(lat, lon, radius_km)
+    etag = representation_etag(request, request_broker.area_version(cells, lat, lon, radius_km, *params))
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        if not (wait > 0 and await request_broker.wait_for_change(cells, min(wait, LONG_POLL_MAX_SECONDS))):
+            return Response(status_code=304, headers={"ETag": etag, "Vary": VARY})
+        etag = representation_etag(request, request_broker.area_version(cells, lat, lon, radius_km, *params))
+    response.headers["ETag"] = etag
+    return None
+
+async def reverse_geocode(lat: float, lng: float) -> Optional[str]:
+    """Look up an address upstream; None when GraphHopper has no match"""
+    data = await graphhopper.reverse_geocode(lat, lng)
+    if data.get('hits') and len(data['hits']) > 0:
+        hit = data['hits'][0]
+        address = hit.get('name', '')
+        if hit.get('city'):
+            address += f", {hit['city']}"
+        if hit.get('country'):
+            address += f", {hit['country']}"
+        return address
+    return None
+
+async def geocode_request_cell(lat: float, lng: float) -> Optional[str]:
+    """reverse_geocode for cells of listed requests; a found address changes the area's ETag"""
+    address = await reverse_geocode(lat, lng)
+    if address:
+        request_broker.touch([request_broker.grid.cell_for(lat, lng)])
+    return address
+
+async def attach_addresses(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Fill in cached addresses; uncached cells are geocoded in the background for later polls"""
+    coordinates = [(float(row["latitude"]), float(row["longitude"])) for row in rows]
+    addresses = await geocode_cache.lookup_many(coordinates, geocode_request_cell)
+    for row, address in zip(rows, addresses):
+        row["address"] = address
+    return rows
 
 # REST Endpoints
 @app.get("/")
 async def root():
-    return {"message": "Cash Exchange API", "version": "2.0.0", "realtime_method": "http_polling"}
+    return {
+        "message": "Cash Exchange API",
+        "version": "2.0.0",
+        "realtime_method": "sse",
+        "realtime_endpoint": "/api/requests/stream"
+    }
 
 @app.get("/health")
 async def health_check():
@@ -151,17 +446,36 @@ async def health_check():
 @app.get("/api/user/me", response_model=UserResponse)
 async def get_current_user_profile(current_user = Depends(get_current_user)):
     try:
-        profile = supabase.table("profiles").select("*").eq("id", current_user.id).execute()
-        if not profile.data:
+        profile = await get_profile(current_user.id)
+        if not profile:
             raise HTTPException(status_code=404, detail="User profile not found")
         
-        return profile.data[0]
+        return profile
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error getting user profile: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@app.delete("/api/user/me", status_code=202)
+async def delete_current_user(current_user = Depends(get_current_user)):
+    """Schedule erasure of all of the caller's data; poll the returned job for progress"""
+    try:
+        job = await erasure_jobs.schedule(current_user.id)
+        logger.info(f"Scheduled erasure job {job['id']} for user {current_user.id}")
+        return job
+    except Exception as e:
+        logger.error(f"Error scheduling erasure for user {current_user.id}: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@app.get("/api/user/me/erasure/{job_id}")
+async def get_erasure_job(job_id: str, current_user = Depends(get_current_user)):
+    """Status and progress of one of the caller's erasure jobs"""
+    job = await erasure_jobs.get(job_id)
+    if not job or job["user_id"] != current_user.id:
+        raise HTTPException(status_code=404, detail="Erasure job not found")
+    return job
+
 @app.post("/api/user/location")
 async def update_user_location(
     location: LocationUpdate,
@@ -177,17 +491,14 @@ async def update_user_location(
                 detail="Invalid coordinates. Latitude must be between -90 and 90, longitude between -180 and 180."
             )
         
-        result = supabase.table("profiles").update({
-            "latitude": location.latitude,
-            "longitude": location.longitude,
-            "updated_at": datetime.utcnow().isoformat()
-        }).eq("id", current_user.id).execute()
-        
-        if not result.data:
+        profile = await get_profile(current_user.id)
+        if not profile:
             logger.error(f"Failed to update location for user {current_user.id}")
-            raise HTTPException(status_code=500, detail="Failed to update location")
+            raise HTTPException(status_code=404, detail="User profile not found")
         
-        logger.info(f"Location updated successfully for user {current_user.id}")
+        # Buffered and written behind; the profile cache serves the new position immediately
+        if location_writer.submit(current_user.id, location.latitude, location.longitude, profile):
+            logger.info(f"Location updated successfully for user {current_user.id}")
         return {"message": "Location updated successfully"}
         
     except HTTPException:
@@ -198,18 +509,25 @@ async def update_user_location(
 
 @app.get("/api/requests/nearby", response_model=List[RequestResponse])
 async def get_nearby_requests(
+    request: Request,
+    response: Response,
     current_user = Depends(get_current_user),
-    radius: float = 5.0,
-    since: Optional[str] = None  # ISO timestamp for incremental updates
+    radius: float = Query(5.0, gt=0, le=MAX_RADIUS_KM),
+    since: Optional[str] = None,  # ISO timestamp for incremental updates
+    wait: float = 0,  # Seconds to hold an unchanged If-None-Match poll open
+    eta: bool = False,  # Fill eta_seconds from cached walking times or estimates
+    limit: Optional[int] = Query(None, ge=1, le=1000),  # Page size; next page via X-Next-Cursor
+    cursor: Optional[str] = None,
+    k: Optional[int] = Query(None, ge=1, le=1000)  # Top-k mode: k closest, widening the radius
 ):
     try:
         logger.info(f"Getting nearby requests for user {current_user.id} within {radius}km")
         
-        user_profile = supabase.table("profiles").select("*").eq("id", current_user.id).execute()
-        if not user_profile.data:
+        with phase("profile"):
+            profile = await get_profile(current_user.id)
+        if not profile:
             raise HTTPException(status_code=404, detail="User profile not found")
         
-        profile = user_profile.data[0]
         user_lat = profile.get("latitude", 0)
         user_lon = profile.get("longitude", 0)
         
@@ -219,34 +537,39 @@ async def get_nearby_requests(
                 detail="User location not set. Please enable location services and update your location."
             )
         
-        # Build query - only get pending requests, exclude own requests
-        query = supabase.table("requests").select("*").eq("status", "pending").neq("user_id", current_user.id)
-        
-        # Add time filter for incremental updates
-        if since:
-            try:
-                since_datetime = datetime.fromisoformat(since.replace('Z', '+00:00'))
-                query = query.gte("created_at", since_datetime.isoformat())
-            except ValueError:
-                # Invalid timestamp format, ignore the filter
-                pass
-        
-        requests_result = query.execute()
-        
-        nearby_requests = []
-        for req in requests_result.data:
-            distance = calculate_distance(
-                user_lat, user_lon,
-                req["latitude"], req["longitude"]
+        # Top-k may widen the search, so its version covers the widest radius
+        with phase("conditional"):
+            not_modified = await check_area_unchanged(
+                request, response, user_lat, user_lon, TOPK_MAX_RADIUS_KM if k else radius, wait,
+                current_user.id, radius, since, eta, limit, cursor, k
             )
-            if distance <= radius:
-                req_with_distance = req.copy()
-                req_with_distance['distance_km'] = distance
-                nearby_requests.append(req_with_distance)
+        if not_modified:
+            return not_modified
+        
+        # Invalid timestamp format means no time filter
+        since_datetime = parse_timestamp(since) if since else None
+        after = decode_cursor(cursor)
+        
+        with phase("query"):
+            if k:
+                nearby_requests = await find_nearest_pending(
+                    user_lat, user_lon, k, radius, current_user.id, since_datetime, after
+                )
+                set_next_cursor(response, nearby_requests, k)
+            else:
+                nearby_requests = await find_pending_in_radius(
+                    user_lat, user_lon, radius, current_user.id, since_datetime, limit, after
+                )
+                set_next_cursor(response, nearby_requests, limit)
+        
+        if eta:
+            with phase("eta"):
+                for req in nearby_requests:
+                    req["eta_seconds"] = eta_matrix.eta(user_lat, user_lon, float(req["latitude"]), float(req["longitude"]))
         
-        nearby_requests.sort(key=lambda x: x['distance_km'])
         logger.info(f"Found {len(nearby_requests)} nearby requests for user {current_user.id}")
-        return nearby_requests
+        with phase("serialize"):
+            return list_response(request, await attach_addresses(nearby_requests), REQUEST_RESPONSE_FIELDS, response)
         
     except HTTPException:
         raise
@@ -256,49 +579,164 @@ async def get_nearby_requests(
 
 @app.get("/api/requests/recent", response_model=List[RequestResponse])
 async def get_recent_requests(
+    request: Request,
+    response: Response,
     current_user = Depends(get_current_user),
-    minutes: int = 5  # Get requests from last N minutes
+    minutes: int = 5,  # Get requests from last N minutes
+    wait: float = 0,  # Seconds to hold an unchanged If-None-Match poll open
+    limit: Optional[int] = Query(None, ge=1, le=1000),  # Page size; next page via X-Next-Cursor
+    cursor: Optional[str] = None
 ):
     """Get recently created requests for polling updates"""
     try:
         since_time = datetime.utcnow() - timedelta(minutes=minutes)
+        after = decode_cursor(cursor)
         
-        user_profile = supabase.table("profiles").select("*").eq("id", current_user.id).execute()
-        if not user_profile.data:
+        profile = await get_profile(current_user.id)
+        if not profile:
             raise HTTPException(status_code=404, detail="User profile not found")
         
-        profile = user_profile.data[0]
         user_lat = profile.get("latitude", 0)
         user_lon = profile.get("longitude", 0)
         
         if user_lat == 0 or user_lon == 0:
             return []  # Return empty if no location
         
-        # Get recent requests
-        requests_result = supabase.table("requests").select("*")\
-            .eq("status", "pending")\
-            .neq("user_id", current_user.id)\
-            .gte("created_at", since_time.isoformat())\
-            .execute()
-        
-        nearby_requests = []
-        for req in requests_result.data:
-            distance = calculate_distance(
-                user_lat, user_lon,
-                req["latitude"], req["longitude"]
-            )
-            if distance <= 5.0:  # 5km radius
-                req_with_distance = req.copy()
-                req_with_distance['distance_km'] = distance
-                nearby_requests.append(req_with_distance)
+        # The minute bucket lets requests age out of the window
+        not_modified = await check_area_unchanged(
+            request, response, user_lat, user_lon, 5.0, wait,
+            current_user.id, minutes, int(time.time() // 60), limit, cursor
+        )
+        if not_modified:
+            return not_modified
         
-        nearby_requests.sort(key=lambda x: x['distance_km'])
-        return nearby_requests
+        # Get recent requests within a 5km radius
+        recent_requests = await find_pending_in_radius(
+            user_lat, user_lon, 5.0, current_user.id, since_time, limit, after
+        )
+        set_next_cursor(response, recent_requests, limit)
+        
+        return list_response(request, await attach_addresses(recent_requests), REQUEST_RESPONSE_FIELDS, response)
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting recent requests: {e}")
         return []
 
+@app.get("/api/requests/changes")
+async def get_request_changes(
+    current_user = Depends(get_current_user),
+    since_seq: Optional[int] = Query(None, ge=0),  # seq from the previous response
+    epoch: Optional[str] = None,  # epoch from the previous response
+    radius: float = Query(5.0, gt=0, le=MAX_RADIUS_KM)
+):
+    """Inserts, updates and tombstones of nearby pending requests since a sequence number.
+
+    Without a usable since_seq/epoch the response is a reset: a full snapshot
+    of nearby pending requests plus the sequence number to continue from.
+    """
+    try:
+        profile = await get_profile(current_user.id)
+        if not profile:
+            raise HTTPException(status_code=404, detail="User profile not found")
+        
+        user_lat = profile.get("latitude", 0)
+        user_lon = profile.get("longitude", 0)
+        if user_lat == 0 or user_lon == 0:
+            raise HTTPException(
+                status_code=400,
+                detail="User location not set. Please enable location services and update your location."
+            )
+        
+        # Read seq first: changes racing the snapshot are replayed next time, harmlessly
+        seq = request_changes.seq
+        entries = request_changes.since(since_seq, epoch) if since_seq is not None else None
+        if entries is None:
+            snapshot = await find_pending_in_radius(user_lat, user_lon, radius, current_user.id)
+            return {
+                "epoch": request_changes.epoch,
+                "seq": seq,
+                "reset": True,
+                "requests": await attach_addresses(snapshot),
+                "changes": []
+            }
+        
+        changes = []
+        for entry in entries:
+            row = entry["request"]
+            if row.get("user_id") == current_user.id:
+                continue
+            try:
+                distance_km = calculate_distance(user_lat, user_lon, float(row["latitude"]), float(row["longitude"]))
+            except (KeyError, TypeError, ValueError):
+                continue
+            if distance_km > radius:
+                continue
+            if entry["op"] == "delete":
+                changes.append({"seq": entry["seq"], "op": "delete", "id": entry["id"]})
+            else:
+                changes.append({
+                    "seq": entry["seq"],
+                    "op": entry["op"],
+                    "id": entry["id"],
+                    "request": {**row, "distance_km": distance_km}
+                })
+        
+        return {
+            "epoch": request_changes.epoch,
+            "seq": entries[-1]["seq"] if entries else seq,
+            "reset": False,
+            "changes": changes
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting request changes: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@app.get("/api/requests/stream")
+async def stream_requests(
+    request: Request,
+    current_user = Depends(get_current_user),
+    radius: float = Query(5.0, gt=0, le=MAX_RADIUS_KM)
+):
+    """Server-Sent Events feed of created/accepted/completed requests nearby"""
+    profile = await get_profile(current_user.id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="User profile not found")
+    
+    user_lat = profile.get("latitude", 0)
+    user_lon = profile.get("longitude", 0)
+    if user_lat == 0 or user_lon == 0:
+        raise HTTPException(
+            status_code=400,
+            detail="User location not set. Please enable location services and update your location."
+        )
+    
+    subscription = request_broker.subscribe(current_user.id, user_lat, user_lon, radius)
+    
+    async def event_stream():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    message = await asyncio.wait_for(subscription.queue.get(), timeout=STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    # Comment line keeps proxies from closing an idle connection
+                    yield ": keep-alive\n\n"
+                    continue
+                event_id = f"id: {message['seq']}\n" if message.get("seq") else ""
+                yield f"{event_id}event: {message['event']}\ndata: {json.dumps(message, default=str)}\n\n"
+        finally:
+            request_broker.unsubscribe(subscription)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/api/requests", response_model=RequestResponse, status_code=201)
 async def create_request(
     request_data: RequestCreate,
@@ -322,15 +760,15 @@ async def create_request(
             )
         
         # Get user profile with better error handling
-        user_profile = supabase.table("profiles").select("*").eq("id", current_user.id).execute()
-        if not user_profile.data:
+        with phase("profile"):
+            profile = await get_profile(current_user.id)
+        if not profile:
             logger.error(f"No profile found for user {current_user.id}")
             raise HTTPException(
                 status_code=404, 
                 detail="User profile not found. Please complete your profile setup."
             )
         
-        profile = user_profile.data[0]
         logger.info(f"User profile: {profile}")
         
         # Check for required location data with better validation
@@ -366,7 +804,7 @@ async def create_request(
             "user_id": current_user.id,
             "user_name": profile.get("name", "Unknown User"),
             "amount": float(request_data.amount),
-            "type": api_type,  # Use the mapped type
+            "type": request_data.type,
             "latitude": lat_float,
             "longitude": lng_float,
             "status": "pending",
@@ -375,19 +813,24 @@ async def create_request(
         
         logger.info(f"Creating request: {request}")
         
-        result = supabase.table("requests").insert(request).execute()
+        with phase("insert"):
+            created = await db.run("insert_request", request)
         
-        if not result.data:
-            logger.error(f"Failed to create request. Supabase response: {result}")
+        if not created:
+            logger.error(f"Failed to create request: {request}")
             raise HTTPException(
                 status_code=500, 
                 detail="Failed to create request in database. Please try again."
             )
         
-        logger.info(f"Request created successfully: {result.data}")
-        
-        # No WebSocket broadcast needed - clients will poll for updates
-        return result.data[0]
+        logger.info(f"Request created successfully: {created}")
+        # Push to stream subscribers in range
+        with phase("publish"):
+            publish_request_change("created", created)
+        geocode_cache.schedule([(lat_float, lng_float)], geocode_request_cell)
+        with phase("match"):
+            match = matching_engine.propose(created)
+        return {**created, "match_id": str(match["id"]) if match else None}
         
     except HTTPException:
         raise
@@ -399,23 +842,72 @@ async def create_request(
             detail="An unexpected error occurred while creating the request. Please try again."
         )
 
+@app.get("/api/requests/{request_id}/matches", response_model=List[RequestResponse])
+async def get_request_matches(
+    request: Request,
+    request_id: str,
+    current_user = Depends(get_current_user),
+    radius: float = Query(5.0, gt=0, le=50),
+    limit: int = Query(5, ge=1, le=50)
+):
+    """Closest opposite-type pending requests with a similar amount"""
+    try:
+        row = matching_engine.get(request_id)
+        if row is None:
+            row = await db.run("get_request", request_id)
+            if not row:
+                raise HTTPException(status_code=404, detail="Request not found")
+            if row.get("status") != "pending":
+                return []
+        
+        matches = matching_engine.find_matches(row, radius, limit=limit)
+        return list_response(request, await attach_addresses(matches), REQUEST_RESPONSE_FIELDS)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting request matches: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
 @app.post("/api/requests/{request_id}/accept")
 async def accept_request(
     request_id: str,
     current_user = Depends(get_current_user)
 ):
+    """Accept a pending request; 409 if someone else got it first"""
     try:
-        result = supabase.table("requests").update({
-            "status": "accepted",
-            "accepted_by": current_user.id,
-            "updated_at": datetime.utcnow().isoformat()
-        }).eq("id", request_id).execute()
+        # Losers of a contended accept are answered without a database round trip
+        if request_claims.claimed_by(request_id):
+            request_claims.rejected += 1
+            raise HTTPException(status_code=409, detail="Request is no longer pending")
         
-        if not result.data:
-            raise HTTPException(status_code=404, detail="Request not found")
+        async with request_claims.lock(request_id):
+            if request_claims.claimed_by(request_id):
+                request_claims.rejected += 1
+                raise HTTPException(status_code=409, detail="Request is no longer pending")
+            
+            # Compare-and-set: only a pending request can become accepted
+            accepted = await db.run("update_request", request_id, {
+                "status": "accepted",
+                "accepted_by": current_user.id,
+                "updated_at": datetime.utcnow().isoformat()
+            }, "pending")
+            
+            if not accepted:
+                row = await db.run("get_request", request_id)
+                if not row:
+                    raise HTTPException(status_code=404, detail="Request not found")
+                if row.get("status") == "pending":
+                    # The update lost a race that left the request pending; nothing to cache
+                    raise HTTPException(status_code=409, detail="Request was modified concurrently, please retry")
+                if row.get("accepted_by"):
+                    request_claims.mark_claimed(request_id, row["accepted_by"])
+                raise HTTPException(status_code=409, detail="Request is no longer pending")
+            
+            request_claims.mark_claimed(request_id, current_user.id)
         
-        # No WebSocket broadcast needed
-        return {"message": "Request accepted successfully", "data": result.data[0]}
+        publish_request_change("accepted", accepted[0])
+        return {"message": "Request accepted successfully", "data": accepted[0]}
     except HTTPException:
         raise
     except Exception as e:
@@ -428,16 +920,16 @@ async def complete_request(
     current_user = Depends(get_current_user)
 ):
     try:
-        result = supabase.table("requests").update({
+        completed = await db.run("update_request", request_id, {
             "status": "completed",
             "updated_at": datetime.utcnow().isoformat()
-        }).eq("id", request_id).execute()
+        })
         
-        if not result.data:
+        if not completed:
             raise HTTPException(status_code=404, detail="Request not found")
         
-        # No WebSocket broadcast needed
-        return {"message": "Request completed successfully", "data": result.data[0]}
+        publish_request_change("completed", completed[0])
+        return {"message": "Request completed successfully", "data": completed[0]}
     except HTTPException:
         raise
     except Exception as e:
@@ -453,27 +945,100 @@ async def get_route(
     current_user = Depends(get_current_user)
 ):
     try:
-        response = requests.get(
-            f"https://graphhopper.com/api/1/route?"
-            f"point={start_lat},{start_lng}&"
-            f"point={end_lat},{end_lng}&"
-            f"vehicle=foot&"
-            f"key={GRAPHHOPPER_API_KEY}"
+        return await route_cache.get_route(graphhopper, start_lat, start_lng, end_lat, end_lng)
+    except GraphHopperError as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=f"Failed to get route from GraphHopper: {e.detail}"
         )
-        
-        if response.status_code == 200:
-            return response.json()
-        else:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail="Failed to get route from GraphHopper"
-            )
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Error getting route: {str(e)}"
         )
 
+@app.post("/api/route/matrix")
+async def get_route_matrix(
+    matrix_request: MatrixRequest,
+    current_user = Depends(get_current_user)
+):
+    """Walking distance/ETA from the caller to each request, closest first"""
+    try:
+        request_ids = list(dict.fromkeys(matrix_request.request_ids))
+        if len(request_ids) > MATRIX_MAX_DESTINATIONS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"At most {MATRIX_MAX_DESTINATIONS} request ids per call"
+            )
+        
+        if matrix_request.latitude is not None and matrix_request.longitude is not None:
+            origin_lat, origin_lon = matrix_request.latitude, matrix_request.longitude
+        else:
+            profile = await get_profile(current_user.id)
+            if not profile or not profile.get("latitude") or not profile.get("longitude"):
+                raise HTTPException(status_code=400, detail="User location not set")
+            origin_lat, origin_lon = float(profile["latitude"]), float(profile["longitude"])
+        
+        rows = {request_id: request_index.get(request_id) for request_id in request_ids}
+        missing = [request_id for request_id, row in rows.items() if row is None]
+        if missing:
+            for row in await db.run("get_requests", missing):
+                rows[str(row["id"])] = row
+        
+        found = [row for row in rows.values() if row is not None]
+        destinations = [(float(row["latitude"]), float(row["longitude"])) for row in found]
+        entries = await eta_matrix.matrix(graphhopper, origin_lat, origin_lon, destinations)
+        
+        matrix = [{"request_id": str(row["id"]), **entry} for row, entry in zip(found, entries)]
+        matrix.sort(key=lambda x: x["eta_seconds"])
+        return {
+            "results": matrix,
+            "not_found": [request_id for request_id, row in rows.items() if row is None]
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting route matrix: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@app.get("/api/cache/stats")
+async def get_cache_stats(current_user = Depends(get_current_user)):
+    """Hit/miss counters for the in-process caches"""
+    return {name: stats() for name, stats in COMPONENT_STATS.items()}
+
+# Admin dependency for operational endpoints
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not admin_token_valid(x_admin_token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin token required")
+
+@app.get("/api/admin/profiles", dependencies=[Depends(require_admin)])
+async def list_profiles(limit: int = Query(50, ge=1, le=1000)):
+    """Newest request profiles first, with their phase timings"""
+    return await run_blocking(profile_store.list, limit)
+
+@app.get("/api/admin/profiles/{profile_id}", dependencies=[Depends(require_admin)])
+async def download_profile(profile_id: str):
+    """A profile's collapsed stacks, ready for flamegraph.pl or speedscope"""
+    stacks = await run_blocking(profile_store.read, profile_id)
+    if stacks is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return Response(
+        stacks,
+        media_type="text/plain",
+        headers={"Content-Disposition": f'attachment; filename="{profile_id}.collapsed"'}
+    )
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics(authorization: Optional[str] = Header(None)):
+    """Prometheus text exposition of request, upstream and cache metrics"""
+    if METRICS_TOKEN and not hmac.compare_digest(authorization or "", f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid metrics token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return Response(registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
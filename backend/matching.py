@@ -0,0 +1,149 @@
+import bisect
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from cache import TTLCache
+from distance import calculate_distance
+from geo_index import CellKey, GeoGrid
+from models import RequestType
+
+MATCH_RADIUS_KM = float(os.getenv("MATCH_RADIUS_KM", "5"))
+# Counterparts may differ in amount by up to this fraction
+MATCH_AMOUNT_TOLERANCE = float(os.getenv("MATCH_AMOUNT_TOLERANCE", "0.1"))
+MATCH_LIMIT = int(os.getenv("MATCH_LIMIT", "5"))
+# Reserve the best counterpart for a new request, hiding it from other proposals
+MATCH_AUTO_RESERVE = os.getenv("MATCH_AUTO_RESERVE", "false").lower() == "true"
+MATCH_RESERVATION_SECONDS = float(os.getenv("MATCH_RESERVATION_SECONDS", "120"))
+
+# Each side of the market is matched against the other
+COUNTERPART = {
+    RequestType.NEED_CASH.value: RequestType.NEED_ONLINE_PAYMENT.value,
+    RequestType.NEED_ONLINE_PAYMENT.value: RequestType.NEED_CASH.value,
+}
+
+BookKey = Tuple[str, CellKey]
+
+
+class MatchingEngine(GeoGrid):
+    """Order books of pending requests per request type and geo cell.
+
+    Each book is a list of (amount, id) kept sorted with bisect, so finding
+    counterparts within an amount tolerance only scans the matching slice of
+    the books in the cells around a request.
+    """
+
+    def __init__(self, cell_size_deg: float = 0.05, reservation_ttl: float = MATCH_RESERVATION_SECONDS):
+        super().__init__(cell_size_deg)
+        self._books: Dict[BookKey, List[Tuple[float, str]]] = {}
+        self._rows: Dict[str, Dict[str, Any]] = {}
+        self._row_books: Dict[str, Tuple[BookKey, float]] = {}
+        # request id -> id of the request it is reserved for, both ways round
+        self.reservations = TTLCache(maxsize=100000, ttl=reservation_ttl)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def upsert(self, row: Dict[str, Any]) -> None:
+        """Add or move a request; rows that are no longer pending are dropped"""
+        request_id = str(row.get("id"))
+        if row.get("status") != "pending":
+            self.remove(request_id)
+            return
+        self._unbook(request_id)
+        if row.get("type") not in COUNTERPART:
+            return
+        try:
+            amount = float(row["amount"])
+            key = (row["type"], self.cell_for(float(row["latitude"]), float(row["longitude"])))
+        except (KeyError, TypeError, ValueError):
+            return
+        bisect.insort(self._books.setdefault(key, []), (amount, request_id))
+        self._rows[request_id] = row
+        self._row_books[request_id] = (key, amount)
+
+    def _unbook(self, request_id: str) -> None:
+        entry = self._row_books.pop(request_id, None)
+        if entry is None:
+            return
+        key, amount = entry
+        self._rows.pop(request_id, None)
+        book = self._books[key]
+        index = bisect.bisect_left(book, (amount, request_id))
+        if index < len(book) and book[index] == (amount, request_id):
+            del book[index]
+        if not book:
+            del self._books[key]
+
+    def remove(self, request_id: str) -> None:
+        """Drop a request and release any reservation it is part of"""
+        self._unbook(request_id)
+        partner = self.reservations.pop(request_id)
+        if partner is not None:
+            self.reservations.pop(partner)
+
+    def get(self, request_id: str) -> Optional[Dict[str, Any]]:
+        return self._rows.get(request_id)
+
+    def find_matches(
+        self,
+        row: Dict[str, Any],
+        radius_km: float = MATCH_RADIUS_KM,
+        tolerance: float = MATCH_AMOUNT_TOLERANCE,
+        limit: int = MATCH_LIMIT,
+    ) -> List[Dict[str, Any]]:
+        """Closest compatible counterparts of a request, each copied with distance_km.
+
+        Ordered by distance, then amount difference. Requests reserved for
+        another request are skipped; the one reserved for this request
+        comes first.
+        """
+        side = COUNTERPART.get(row.get("type"))
+        if side is None:
+            return []
+        request_id = str(row.get("id"))
+        lat, lon, amount = float(row["latitude"]), float(row["longitude"]), float(row["amount"])
+        low, high = amount * (1 - tolerance), amount * (1 + tolerance)
+        reserved = self.reservations.get(request_id, count=False)
+
+        candidates = []
+        for cell in self.cells_in_radius(lat, lon, radius_km):
+            book = self._books.get((side, cell))
+            if not book:
+                continue
+            start = bisect.bisect_left(book, (low, ""))
+            for other_amount, other_id in book[start:]:
+                if other_amount > high:
+                    break
+                other = self._rows[other_id]
+                if other.get("user_id") == row.get("user_id"):
+                    continue
+                holder = self.reservations.get(other_id, count=False)
+                if holder is not None and holder != request_id:
+                    continue
+                distance = calculate_distance(lat, lon, float(other["latitude"]), float(other["longitude"]))
+                if distance <= radius_km:
+                    candidates.append((other_id != reserved, distance, abs(other_amount - amount), other_id))
+
+        candidates.sort()
+        return [{**self._rows[other_id], "distance_km": distance} for _, distance, _, other_id in candidates[:limit]]
+
+    def reserve(self, request_id: str, counterpart_id: str) -> None:
+        """Pair two requests so neither is proposed to anyone else for a while"""
+        self.reservations.set(request_id, counterpart_id)
+        self.reservations.set(counterpart_id, request_id)
+
+    def propose(self, row: Dict[str, Any], auto_reserve: bool = MATCH_AUTO_RESERVE) -> Optional[Dict[str, Any]]:
+        """Best counterpart for a newly created request, reserving it when enabled"""
+        matches = self.find_matches(row, limit=1)
+        if not matches:
+            return None
+        if auto_reserve:
+            self.reserve(str(row.get("id")), str(matches[0]["id"]))
+        return matches[0]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"requests": len(self._rows), "books": len(self._books), "reservations": len(self.reservations) // 2}
+
+
+# Global matching engine over pending requests
+matching_engine = MatchingEngine()
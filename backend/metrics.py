@@ -0,0 +1,267 @@
+import asyncio
+import bisect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Tuple
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# When set, /metrics requires "Authorization: Bearer <token>"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+EVENT_LOOP_LAG_INTERVAL_SECONDS = float(os.getenv("EVENT_LOOP_LAG_INTERVAL_SECONDS", "0.5"))
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (0, 1, 10, 50, 100, 500, 1000, 5000, 10000, 50000)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A named metric family with one series per label-value tuple"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            series = list(self._series.items())
+        for labels, value in series:
+            lines.extend(self._render_series(labels, value))
+        return lines
+
+    def _render_series(self, labels: Tuple[str, ...], value: Any) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self._series[labels] = value
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(Metric):
+    """Fixed-bucket histogram; each series is [bucket counts..., +Inf count, sum]"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def _render_series(self, labels: Tuple[str, ...], series: List[float]) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), series):
+            cumulative += count
+            le = _format_labels(self.labelnames, labels, f'le="{_format_value(float(bound))}"')
+            lines.append(f"{self.name}_bucket{le} {cumulative}")
+        plain = _format_labels(self.labelnames, labels)
+        lines.append(f"{self.name}_sum{plain} {_format_value(float(series[-1]))}")
+        lines.append(f"{self.name}_count{plain} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Metric families plus stats callbacks rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self.metrics: List[Metric] = []
+        self.stats_sources: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def add_stats(self, name: str, source: Callable[[], Dict[str, Any]]) -> None:
+        """Export the numeric fields of a component's stats() as payswap_component_stat gauges"""
+        self.stats_sources[name] = source
+
+    def _stats_lines(self) -> List[str]:
+        lines = [
+            "# HELP payswap_component_stat Numeric fields of in-process cache and component stats",
+            "# TYPE payswap_component_stat gauge",
+        ]
+        for component, source in self.stats_sources.items():
+            try:
+                stats = source()
+            except Exception as e:
+                logger.warning(f"Stats for {component} unavailable: {e}")
+                continue
+            for path, value in _flatten(stats):
+                labels = _format_labels(("component", "stat"), (component, path))
+                lines.append(f"payswap_component_stat{labels} {_format_value(value)}")
+        return lines
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        if self.stats_sources:
+            lines.extend(self._stats_lines())
+        return "\n".join(lines) + "\n"
+
+
+def _flatten(stats: Dict[str, Any], prefix: str = "") -> Iterator[Tuple[str, float]]:
+    for key, value in stats.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from _flatten(value, path + ".")
+        elif isinstance(value, bool):
+            yield path, int(value)
+        elif isinstance(value, (int, float)):
+            yield path, value
+
+
+registry = Registry()
+
+http_request_duration = registry.register(Histogram(
+    "payswap_http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status")
+))
+http_requests_in_flight = registry.register(Gauge(
+    "payswap_http_requests_in_flight", "HTTP requests currently being served"
+))
+upstream_duration = registry.register(Histogram(
+    "payswap_upstream_duration_seconds", "Latency of calls to Supabase, GraphHopper and storage backends",
+    ("upstream", "operation", "outcome")
+))
+nearby_rows_fetched = registry.register(Counter(
+    "payswap_nearby_rows_fetched_total", "Candidate rows read by nearby queries", ("source",)
+))
+nearby_rows_returned = registry.register(Counter(
+    "payswap_nearby_rows_returned_total", "Rows left after the exact radius filter", ("source",)
+))
+nearby_candidates = registry.register(Histogram(
+    "payswap_nearby_candidates", "Candidate rows read per nearby query", ("source",), buckets=ROW_BUCKETS
+))
+event_loop_lag = registry.register(Histogram(
+    "payswap_event_loop_lag_seconds", "Delay of event loop wakeups past their deadline"
+))
+event_loop_lag_last = registry.register(Gauge(
+    "payswap_event_loop_lag_last_seconds", "Most recent event loop lag sample"
+))
+
+
+@contextmanager
+def upstream_timer(upstream: str, operation: str):
+    """Time a call to an upstream service, labelled ok or error by whether it raised"""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        upstream_duration.observe(time.perf_counter() - start, upstream, operation, outcome)
+
+
+def timed(upstream: str, operation: str, func: Callable[..., Any]) -> Callable[..., Any]:
+    """Wrap a blocking call so it's timed where it runs, e.g. run_blocking(timed(...))"""
+    def call(*args, **kwargs):
+        with upstream_timer(upstream, operation):
+            return func(*args, **kwargs)
+    return call
+
+
+def observe_nearby(source: str, fetched: int, returned: int) -> None:
+    """Record how many candidate rows a nearby query read against how many it returned"""
+    nearby_rows_fetched.inc(source, amount=fetched)
+    nearby_rows_returned.inc(source, amount=returned)
+    nearby_candidates.observe(fetched, source)
+
+
+async def monitor_event_loop(interval: float = EVENT_LOOP_LAG_INTERVAL_SECONDS) -> None:
+    """Sample event loop lag until cancelled"""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(loop.time() - start - interval, 0.0)
+        event_loop_lag.observe(lag)
+        event_loop_lag_last.set(lag)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route latency and in-flight requests.
+
+    Requests are labelled by route template rather than raw path so
+    cardinality stays bounded; unmatched paths share one label.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_requests_in_flight.dec()
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            http_request_duration.observe(time.perf_counter() - start, scope["method"], route, str(status))
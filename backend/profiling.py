@@ -0,0 +1,306 @@
+import asyncio
+import contextvars
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from blocking_io import run_blocking
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Admin token for the X-Profile header and the profile endpoints; both are disabled when unset
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+# Fraction of requests profiled without being asked to, e.g. 0.001
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Comma-separated path prefixes eligible for rate sampling
+PROFILE_PATHS = [path for path in os.getenv("PROFILE_PATHS", "/api/requests").split(",") if path]
+# Prefixes never rate-sampled, even under PROFILE_PATHS; streams are long-lived and mostly idle
+PROFILE_EXCLUDED_PATHS = [path for path in os.getenv("PROFILE_EXCLUDED_PATHS", "/api/requests/stream").split(",") if path]
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+# Oldest profiles are deleted beyond this many
+PROFILE_MAX_COUNT = int(os.getenv("PROFILE_MAX_COUNT", "200"))
+PROFILE_INTERVAL_SECONDS = float(os.getenv("PROFILE_INTERVAL_SECONDS", "0.005"))
+# Profiles of longer requests are cut off and saved at this point
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "30"))
+
+PROFILE_ID_PATTERN = re.compile(r"^[0-9]{13}-[0-9a-f]{8}$")
+# Frames of the server and event loop below the request handler add nothing to a profile
+SKIPPED_MODULES = ("asyncio", "starlette", "fastapi", "uvicorn", "anyio", "contextlib", "threading", "runpy", __name__)
+
+
+def admin_token_valid(token: Optional[str]) -> bool:
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token or "", ADMIN_TOKEN)
+
+
+class ProfileSession:
+    """Samples and phase timings of one profiled request"""
+
+    def __init__(self, method: str, path: str, reason: str):
+        self.id = f"{int(time.time() * 1000):013d}-{uuid.uuid4().hex[:8]}"
+        self.method = method
+        self.path = path
+        self.reason = reason
+        self.started = time.time()
+        self.start = time.perf_counter()
+        self.task = asyncio.current_task()
+        self.thread_id = threading.get_ident()
+        self.phases: List[str] = []
+        self.phase_seconds: Dict[str, float] = {}
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.status: Optional[int] = None
+        self.truncated = False
+
+    def sample(self, frame, loop: asyncio.AbstractEventLoop) -> None:
+        """Record where the request is: its stack when running, its phase when suspended"""
+        prefix = [f"phase:{name}" for name in self.phases] or ["phase:(none)"]
+        if frame is not None and asyncio.current_task(loop) is self.task:
+            stack = prefix + collapse(frame)
+        else:
+            stack = prefix + ["(waiting)"]
+        self.stacks[";".join(stack)] += 1
+        self.samples += 1
+
+    def metadata(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "reason": self.reason,
+            "status": self.status,
+            "started_at": self.started,
+            "duration_ms": (time.perf_counter() - self.start) * 1000,
+            "samples": self.samples,
+            "truncated": self.truncated,
+            "interval_ms": PROFILE_INTERVAL_SECONDS * 1000,
+            "phases_ms": {name: seconds * 1000 for name, seconds in self.phase_seconds.items()},
+        }
+
+
+def collapse(frame) -> List[str]:
+    """Frames from the outermost application frame down to frame, as "function (file)" names"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        module = frame.f_globals.get("__name__", "")
+        if module.split(".")[0] not in SKIPPED_MODULES:
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+        frame = frame.f_back
+    names.reverse()
+    return names
+
+
+_session: contextvars.ContextVar[Optional[ProfileSession]] = contextvars.ContextVar("profile_session", default=None)
+
+
+@contextmanager
+def phase(name: str):
+    """Label samples taken inside the block and time it; free when the request isn't profiled"""
+    session = _session.get()
+    if session is None:
+        yield
+        return
+    session.phases.append(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        session.phases.pop()
+        session.phase_seconds[name] = session.phase_seconds.get(name, 0.0) + time.perf_counter() - start
+
+
+class Sampler:
+    """Background thread sampling the event loop thread while any request is profiled.
+
+    The thread parks on an event when no session is active, so profiling
+    costs nothing until a request opts in. Sessions running longer than
+    max_seconds are dropped and handed to on_expire.
+    """
+
+    def __init__(
+        self,
+        on_expire: Optional[Callable[[ProfileSession], None]] = None,
+        interval: float = PROFILE_INTERVAL_SECONDS,
+        max_seconds: float = PROFILE_MAX_SECONDS,
+    ):
+        self.on_expire = on_expire
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.sessions: Dict[str, ProfileSession] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self._active = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, session: ProfileSession) -> None:
+        with self._lock:
+            self._loop = asyncio.get_running_loop()
+            self.sessions[session.id] = session
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+                self._thread.start()
+        self._active.set()
+
+    def stop(self, session: ProfileSession) -> bool:
+        """Stop sampling a session; False if it had already expired"""
+        with self._lock:
+            stopped = self.sessions.pop(session.id, None) is not None
+            if not self.sessions:
+                self._active.clear()
+        return stopped
+
+    def _run(self) -> None:
+        while True:
+            self._active.wait()
+            time.sleep(self.interval)
+            # Held while sampling so a stopped session is never written to while it's saved
+            with self._lock:
+                if not self.sessions:
+                    continue
+                frames = sys._current_frames()
+                now = time.perf_counter()
+                expired = [session for session in self.sessions.values() if now - session.start > self.max_seconds]
+                for session in expired:
+                    session.truncated = True
+                    del self.sessions[session.id]
+                if not self.sessions:
+                    self._active.clear()
+                for session in self.sessions.values():
+                    session.sample(frames.get(session.thread_id), self._loop)
+            for session in expired:
+                if self.on_expire is not None:
+                    try:
+                        self.on_expire(session)
+                    except Exception as e:
+                        logger.error(f"Failed to save profile {session.id}: {e}")
+
+
+class ProfileStore:
+    """Bounded on-disk ring buffer of collapsed-stack profiles with JSON metadata"""
+
+    def __init__(self, path: str = PROFILE_DIR, max_count: int = PROFILE_MAX_COUNT):
+        self.path = path
+        self.max_count = max_count
+
+    def _file(self, profile_id: str, suffix: str) -> str:
+        return os.path.join(self.path, f"{profile_id}.{suffix}")
+
+    def _ids(self) -> List[str]:
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(name[:-5] for name in os.listdir(self.path) if name.endswith(".json"))
+
+    def save(self, session: ProfileSession) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        with open(self._file(session.id, "collapsed"), "w") as f:
+            for stack, count in session.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        # Metadata goes last: a profile is listed only once it's complete
+        with open(self._file(session.id, "json"), "w") as f:
+            json.dump(session.metadata(), f)
+        for stale in self._ids()[:-self.max_count]:
+            for suffix in ("json", "collapsed"):
+                try:
+                    os.remove(self._file(stale, suffix))
+                except FileNotFoundError:
+                    pass
+
+    def list(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Metadata of the newest profiles first"""
+        profiles = []
+        for profile_id in reversed(self._ids()[-limit:]):
+            try:
+                with open(self._file(profile_id, "json")) as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return profiles
+
+    def read(self, profile_id: str) -> Optional[str]:
+        """Collapsed stacks of a profile, ready for flamegraph.pl or speedscope"""
+        if not PROFILE_ID_PATTERN.match(profile_id):
+            return None
+        try:
+            with open(self._file(profile_id, "collapsed")) as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+
+profile_store = ProfileStore()
+sampler = Sampler(on_expire=profile_store.save)
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling requests that opt in.
+
+    A request is profiled when it sends "X-Profile: 1" with a valid
+    X-Admin-Token, or at random at PROFILE_SAMPLE_RATE for paths under
+    PROFILE_PATHS. Randomly sampled requests that turn out to be event
+    streams are dropped. Profiled responses carry an X-Profile-Id header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def _reason(self, scope) -> Optional[str]:
+        headers = dict(scope.get("headers") or [])
+        if headers.get(b"x-profile") == b"1" and admin_token_valid(headers.get(b"x-admin-token", b"").decode("latin-1")):
+            return "header"
+        path = scope["path"]
+        if (
+            PROFILE_SAMPLE_RATE
+            and path.startswith(tuple(PROFILE_PATHS))
+            and not path.startswith(tuple(PROFILE_EXCLUDED_PATHS))
+            and random.random() < PROFILE_SAMPLE_RATE
+        ):
+            return "sampled"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        reason = self._reason(scope) if scope["type"] == "http" else None
+        if reason is None:
+            await self.app(scope, receive, send)
+            return
+
+        session = ProfileSession(scope["method"], scope["path"], reason)
+        discarded = False
+
+        async def send_with_profile_id(message):
+            nonlocal discarded
+            if message["type"] == "http.response.start":
+                session.status = message["status"]
+                headers = list(message.get("headers", []))
+                content_type = dict(headers).get(b"content-type", b"")
+                if reason == "sampled" and content_type.startswith(b"text/event-stream"):
+                    discarded = True
+                    sampler.stop(session)
+                else:
+                    message["headers"] = headers + [(b"x-profile-id", session.id.encode())]
+            await send(message)
+
+        token = _session.set(session)
+        sampler.start(session)
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            # An expired session was already saved by the sampler
+            stopped = sampler.stop(session)
+            _session.reset(token)
+            if stopped and not discarded:
+                try:
+                    await run_blocking(profile_store.save, session)
+                except Exception as e:
+                    logger.error(f"Failed to save profile {session.id}: {e}")
@@ -0,0 +1,59 @@
+from typing import Any, Dict, Iterator, Optional
+
+# Columns the list endpoints need from requests; everything RequestResponse carries
+REQUEST_FIELDS = ("id", "user_id", "user_name", "amount", "type", "latitude", "longitude", "created_at", "status")
+REQUEST_COLUMNS = ", ".join(REQUEST_FIELDS)
+PROFILE_COLUMNS = "id, email, name, latitude, longitude, updated_at"
+
+
+class RequestRecord:
+    """Compact, slotted copy of a pending request row.
+
+    Holds only the columns the read paths use, with coordinates and amount
+    already converted to floats. It supports the read-only mapping protocol,
+    so code written against row dicts works on records unchanged.
+    """
+
+    __slots__ = REQUEST_FIELDS
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> "RequestRecord":
+        record = cls.__new__(cls)
+        record.id = str(row.get("id"))
+        record.user_id = row.get("user_id")
+        record.user_name = row.get("user_name")
+        record.amount = float(row["amount"]) if row.get("amount") is not None else None
+        record.type = row.get("type")
+        record.latitude = float(row["latitude"])
+        record.longitude = float(row["longitude"])
+        record.created_at = row.get("created_at")
+        record.status = row.get("status")
+        return record
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key)
+
+    def get(self, key: str, default: Optional[Any] = None) -> Any:
+        return getattr(self, key, default) if key in REQUEST_FIELDS else default
+
+    def keys(self):
+        return REQUEST_FIELDS
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(REQUEST_FIELDS)
+
+    def __len__(self) -> int:
+        return len(REQUEST_FIELDS)
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, RequestRecord):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in REQUEST_FIELDS)
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"RequestRecord(id={self.id!r}, status={self.status!r})"
@@ -0,0 +1,128 @@
+import asyncio
+import hashlib
+import logging
+import os
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from distance import calculate_distance
+from geo_index import CellKey, GeoGrid
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "100"))
+STREAM_MAX_RADIUS_KM = float(os.getenv("STREAM_MAX_RADIUS_KM", "50"))
+
+
+class Subscription:
+    """A connected client listening for request events around a point"""
+
+    __slots__ = ("user_id", "latitude", "longitude", "radius_km", "cells", "queue")
+
+    def __init__(self, user_id: str, latitude: float, longitude: float, radius_km: float, cells: List[CellKey]):
+        self.user_id = user_id
+        self.latitude = latitude
+        self.longitude = longitude
+        self.radius_km = radius_km
+        self.cells = cells
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+
+
+class RequestEventBroker:
+    """Fans out request events to subscribers grouped by geo cell.
+
+    Each subscriber is registered under every cell its radius overlaps, so
+    publishing an event only touches the subscribers of the event's cell.
+    The broker also keeps a version counter per cell, which conditional
+    and long-poll requests use to tell whether their area changed. The
+    counters restart with every process, so versions also hash a random
+    epoch; a version issued by another process or an earlier run never
+    matches.
+    """
+
+    def __init__(self, cell_size_deg: float = 0.05):
+        self.grid = GeoGrid(cell_size_deg)
+        self._subscribers: Dict[CellKey, Set[Subscription]] = {}
+        self._versions: Dict[CellKey, int] = {}
+        self._waiters: Dict[CellKey, Set[asyncio.Future]] = {}
+        self.epoch = uuid.uuid4().hex[:12]
+
+    def subscriber_count(self) -> int:
+        return len({sub for subs in self._subscribers.values() for sub in subs})
+
+    def subscribe(self, user_id: str, latitude: float, longitude: float, radius_km: float) -> Subscription:
+        """Register a subscriber for events within radius_km of a point"""
+        radius_km = min(radius_km, STREAM_MAX_RADIUS_KM)
+        cells = self.grid.cells_in_radius(latitude, longitude, radius_km)
+        sub = Subscription(user_id, latitude, longitude, radius_km, cells)
+        for key in cells:
+            self._subscribers.setdefault(key, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        for key in sub.cells:
+            subs = self._subscribers.get(key)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subscribers[key]
+
+    def area_version(self, cells: Iterable[CellKey], *params: Any) -> str:
+        """Opaque version of a set of cells, usable as an ETag"""
+        state = ",".join(f"{key}:{self._versions.get(key, 0)}" for key in cells if key in self._versions)
+        digest = hashlib.sha1(f"{self.epoch}|{params}|{state}".encode()).hexdigest()[:20]
+        return f'"{digest}"'
+
+    def touch(self, cells: Iterable[CellKey]) -> None:
+        """Bump cell versions and wake long-pollers waiting on them"""
+        for key in cells:
+            self._versions[key] = self._versions.get(key, 0) + 1
+            for waiter in self._waiters.pop(key, ()):
+                if not waiter.done():
+                    waiter.set_result(True)
+
+    async def wait_for_change(self, cells: List[CellKey], timeout: float) -> bool:
+        """Wait until any of the cells changes; False on timeout"""
+        waiter = asyncio.get_running_loop().create_future()
+        for key in cells:
+            self._waiters.setdefault(key, set()).add(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            for key in cells:
+                waiters = self._waiters.get(key)
+                if waiters is not None:
+                    waiters.discard(waiter)
+                    if not waiters:
+                        del self._waiters[key]
+
+    def publish(self, event: str, row: Dict[str, Any], seq: Optional[int] = None) -> int:
+        """Deliver an event to subscribers in range; returns the number reached"""
+        try:
+            lat, lon = float(row["latitude"]), float(row["longitude"])
+        except (KeyError, TypeError, ValueError):
+            return 0
+
+        cell = self.grid.cell_for(lat, lon)
+        self.touch([cell])
+
+        message = {"event": event, "seq": seq, "request": row}
+        delivered = 0
+        for sub in list(self._subscribers.get(cell, ())):
+            if calculate_distance(sub.latitude, sub.longitude, lat, lon) > sub.radius_km:
+                continue
+            if sub.queue.full():
+                # Slow consumer: drop its oldest event rather than block the publisher
+                sub.queue.get_nowait()
+            sub.queue.put_nowait(message)
+            delivered += 1
+        return delivered
+
+
+# Global broker for request events
+request_broker = RequestEventBroker()
@@ -0,0 +1,157 @@
+import logging
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from cache import SingleFlight, TTLCache
+from distance import calculate_distance
+from graphhopper import GraphHopperClient, GraphHopperError
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Decimal places coordinates are rounded to; 4 places is roughly 11 m
+ROUTE_CACHE_PRECISION = int(os.getenv("ROUTE_CACHE_PRECISION", "4"))
+ROUTE_CACHE_SIZE = int(os.getenv("ROUTE_CACHE_SIZE", "10000"))
+ROUTE_CACHE_TTL_SECONDS = float(os.getenv("ROUTE_CACHE_TTL_SECONDS", "3600"))
+
+# Straight-line fallback: typical walking pace and street-grid detour
+WALKING_SPEED_MPS = float(os.getenv("WALKING_SPEED_MPS", "1.4"))
+WALKING_DETOUR_FACTOR = float(os.getenv("WALKING_DETOUR_FACTOR", "1.3"))
+
+RouteKey = Tuple[float, float, float, float]
+
+
+def estimate_walk(start_lat: float, start_lng: float, end_lat: float, end_lng: float) -> Tuple[float, float]:
+    """Haversine-based (distance_m, eta_seconds) estimate of a walk"""
+    distance_m = calculate_distance(start_lat, start_lng, end_lat, end_lng) * 1000 * WALKING_DETOUR_FACTOR
+    return distance_m, distance_m / WALKING_SPEED_MPS
+
+
+def matrix_row(data: Dict[str, Any], count: int) -> Tuple[List[Any], List[Any]]:
+    """Distances and times from the single origin of a Matrix API answer"""
+    try:
+        distances, times = data["distances"][0], data["times"][0]
+    except (KeyError, IndexError, TypeError) as e:
+        raise GraphHopperError(502, f"Malformed matrix response: {e!r}")
+    if not isinstance(distances, list) or not isinstance(times, list) or len(distances) != count or len(times) != count:
+        raise GraphHopperError(502, "Matrix response doesn't match the requested points")
+    return distances, times
+
+
+class RouteCache:
+    """Walking routes cached by quantized start/end coordinates.
+
+    Nearby starts and ends share one entry, and concurrent misses for the
+    same key are coalesced into a single upstream call.
+    """
+
+    def __init__(
+        self,
+        precision: int = ROUTE_CACHE_PRECISION,
+        maxsize: int = ROUTE_CACHE_SIZE,
+        ttl: float = ROUTE_CACHE_TTL_SECONDS,
+    ):
+        self.precision = precision
+        self.routes = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.flights = SingleFlight()
+
+    def key(self, start_lat: float, start_lng: float, end_lat: float, end_lng: float) -> RouteKey:
+        return tuple(round(value, self.precision) for value in (start_lat, start_lng, end_lat, end_lng))
+
+    async def get_route(
+        self,
+        client: GraphHopperClient,
+        start_lat: float,
+        start_lng: float,
+        end_lat: float,
+        end_lng: float,
+    ) -> Dict[str, Any]:
+        """Return a cached route, fetching it once on a miss"""
+        key = self.key(start_lat, start_lng, end_lat, end_lng)
+        route = self.routes.get(key)
+        if route is not None:
+            return route
+
+        async def fetch():
+            # The quantized points are requested so the entry matches its key
+            result = await client.route(*key)
+            self.routes.set(key, result)
+            return result
+
+        return await self.flights.run(key, fetch)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.routes.stats(), "coalesced": self.flights.coalesced, "in_flight": len(self.flights)}
+
+
+class EtaMatrix:
+    """Walking distance/ETA from one origin to many destinations.
+
+    Pairs are cached by quantized coordinates; the uncached ones are
+    fetched with a single Matrix API call, and pairs GraphHopper can't
+    answer fall back to a haversine estimate.
+    """
+
+    def __init__(
+        self,
+        precision: int = ROUTE_CACHE_PRECISION,
+        maxsize: int = ROUTE_CACHE_SIZE * 10,
+        ttl: float = ROUTE_CACHE_TTL_SECONDS,
+    ):
+        self.precision = precision
+        self.pairs = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def key(self, start_lat: float, start_lng: float, end_lat: float, end_lng: float) -> RouteKey:
+        return tuple(round(value, self.precision) for value in (start_lat, start_lng, end_lat, end_lng))
+
+    def eta(self, start_lat: float, start_lng: float, end_lat: float, end_lng: float) -> float:
+        """Cached ETA in seconds, or the estimate; never calls upstream"""
+        cached = self.pairs.get(self.key(start_lat, start_lng, end_lat, end_lng), count=False)
+        if cached is not None:
+            return cached[1]
+        return estimate_walk(start_lat, start_lng, end_lat, end_lng)[1]
+
+    async def matrix(
+        self,
+        client: GraphHopperClient,
+        lat: float,
+        lng: float,
+        destinations: List[Tuple[float, float]],
+    ) -> List[Dict[str, Any]]:
+        """One {distance_m, eta_seconds, source} entry per destination, in order"""
+        results: List[Optional[Dict[str, Any]]] = [None] * len(destinations)
+        missing = []
+        for i, (end_lat, end_lng) in enumerate(destinations):
+            cached = self.pairs.get(self.key(lat, lng, end_lat, end_lng))
+            if cached is not None:
+                results[i] = {"distance_m": cached[0], "eta_seconds": cached[1], "source": "cache"}
+            else:
+                missing.append(i)
+
+        if missing:
+            try:
+                data = await client.matrix([(lat, lng)], [destinations[i] for i in missing])
+                distances, times = matrix_row(data, len(missing))
+            except GraphHopperError as e:
+                logger.warning(f"Matrix call failed, using estimates: {e}")
+                distances = times = [None] * len(missing)
+
+            for i, distance_m, eta_seconds in zip(missing, distances, times):
+                end_lat, end_lng = destinations[i]
+                if not isinstance(distance_m, (int, float)) or not isinstance(eta_seconds, (int, float)):
+                    distance_m, eta_seconds = estimate_walk(lat, lng, end_lat, end_lng)
+                    results[i] = {"distance_m": distance_m, "eta_seconds": eta_seconds, "source": "estimate"}
+                    continue
+                self.pairs.set(self.key(lat, lng, end_lat, end_lng), (distance_m, eta_seconds))
+                results[i] = {"distance_m": distance_m, "eta_seconds": eta_seconds, "source": "graphhopper"}
+
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        return self.pairs.stats()
+
+
+# Global route and ETA caches
+route_cache = RouteCache()
+eta_matrix = EtaMatrix()
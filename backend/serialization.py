@@ -0,0 +1,120 @@
+import gzip
+import json
+import os
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence
+
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the standard library encoder is the fallback
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # without msgpack, MessagePack is simply not offered
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:  # without brotli, gzip is the only compression offered
+    brotli = None
+
+# Bodies smaller than this are sent uncompressed
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "5"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+# {"fields": [...], "rows": [[...], ...]}: field names are sent once instead of per row
+COLUMNAR_MEDIA_TYPE = "application/vnd.payswap.columnar+json"
+# list_response bodies differ by these request headers
+VARY = "Accept, Accept-Encoding"
+
+
+def dumps_json(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value, default=str)
+    return json.dumps(value, default=str, separators=(",", ":")).encode()
+
+
+def accepted_media_types(accept: str) -> List[str]:
+    """Media types from an Accept header, dropping any with q=0"""
+    types = []
+    for part in accept.split(","):
+        media_type, *params = [item.strip() for item in part.split(";")]
+        if media_type and "q=0" not in params and "q=0.0" not in params:
+            types.append(media_type.lower())
+    return types
+
+
+def negotiate_media_type(accept: str) -> str:
+    """Body format list_response uses for an Accept header"""
+    accepted = accepted_media_types(accept)
+    if msgpack is not None and any(media_type in accepted for media_type in MSGPACK_MEDIA_TYPES):
+        return MSGPACK_MEDIA_TYPES[0]
+    if COLUMNAR_MEDIA_TYPE in accepted:
+        return COLUMNAR_MEDIA_TYPE
+    return "application/json"
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Best supported content coding from an Accept-Encoding header"""
+    codings = accepted_media_types(accept_encoding)
+    if brotli is not None and "br" in codings:
+        return "br"
+    if "gzip" in codings:
+        return "gzip"
+    return None
+
+
+def representation_etag(request: Request, etag: str) -> str:
+    """Qualify a data-version ETag with the negotiated format and coding.
+
+    Identity, gzip and br bodies, and JSON, MessagePack and columnar
+    bodies, of the same data are different byte sequences, so each gets
+    its own strong ETag.
+    """
+    media_type = negotiate_media_type(request.headers.get("accept", ""))
+    encoding = negotiate_encoding(request.headers.get("accept-encoding", "")) or "identity"
+    version = etag.strip('"')
+    return f'"{version}.{media_type.rsplit("/", 1)[-1]}.{encoding}"'
+
+
+def list_response(
+    request: Request,
+    rows: Iterable[Mapping[str, Any]],
+    fields: Sequence[str],
+    response: Optional[Response] = None,
+) -> Response:
+    """Encode rows we built ourselves straight to a response, skipping response_model validation.
+
+    Each row is projected onto fields. The body is JSON, MessagePack or
+    columnar JSON depending on the Accept header, and is compressed when
+    it is large enough and the client accepts it. Headers already set on
+    response (ETag, cursors) are carried over.
+    """
+    media_type = negotiate_media_type(request.headers.get("accept", ""))
+    if media_type in MSGPACK_MEDIA_TYPES:
+        body = msgpack.packb([{field: row.get(field) for field in fields} for row in rows], default=str)
+    elif media_type == COLUMNAR_MEDIA_TYPE:
+        body = dumps_json({"fields": list(fields), "rows": [[row.get(field) for field in fields] for row in rows]})
+    else:
+        body = dumps_json([{field: row.get(field) for field in fields} for row in rows])
+
+    headers: Dict[str, str] = {}
+    if response is not None:
+        headers.update((key, value) for key, value in response.headers.items() if key not in ("content-length", "content-type"))
+    headers["Vary"] = VARY
+
+    if len(body) >= COMPRESS_MIN_BYTES:
+        encoding = negotiate_encoding(request.headers.get("accept-encoding", ""))
+        if encoding == "br":
+            body = brotli.compress(body, quality=BROTLI_QUALITY)
+        elif encoding == "gzip":
+            body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+
+    return Response(content=body, media_type=media_type, headers=headers)
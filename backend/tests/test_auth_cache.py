@@ -0,0 +1,31 @@
+import asyncio
+import time
+
+import pytest
+
+from auth_cache import InvalidToken, TokenVerifier
+
+
+jwt = pytest.importorskip("jwt")
+
+
+class Refused(Exception):
+    status = 401
+
+
+def test_rejections_outlive_max_staleness_until_the_token_expires():
+    calls = []
+
+    def fetch_remote(token):
+        calls.append(token)
+        raise Refused("invalid token")
+
+    verifier = TokenVerifier(fetch_remote=fetch_remote, jwt_secret=None, jwks_url=None, max_staleness=0.01)
+    token = jwt.encode({"sub": "revoked", "exp": int(time.time()) + 3600}, "a secret this verifier does not know about", algorithm="HS256")
+
+    for _ in range(2):
+        with pytest.raises(InvalidToken):
+            asyncio.run(verifier.authenticate(token))
+        time.sleep(0.02)
+
+    assert len(calls) == 1
@@ -0,0 +1,19 @@
+from changelog import ChangeLog
+
+
+def row(request_id: str, user_id: str, status: str = "pending"):
+    return {"id": request_id, "user_id": user_id, "user_name": f"name of {user_id}",
+            "latitude": 12.97, "longitude": 77.59, "status": status}
+
+
+def test_redact_turns_a_users_changes_into_tombstones():
+    log = ChangeLog()
+    log.append("insert", row("a", "erased"))
+    log.append("insert", row("b", "kept"))
+    log.append("update", row("a", "erased"))
+
+    assert log.redact("erased") == 2
+    entries = log.since(0, log.epoch)
+    assert [(entry["op"], entry["id"]) for entry in entries] == [("delete", "a"), ("insert", "b"), ("delete", "a")]
+    assert entries[0]["request"] == {"id": "a", "latitude": 12.97, "longitude": 77.59, "status": "deleted"}
+    assert entries[1]["request"]["user_name"] == "name of kept"
@@ -0,0 +1,59 @@
+import random
+
+import pytest
+
+from distance import nearest
+
+
+def scattered_rows():
+    """Rows around a point, with ties on distance: same spot, and mirrored east/west"""
+    random.seed(7)
+    rows = []
+    for i in range(40):
+        lat, lon = 12.97 + random.uniform(-0.05, 0.05), 77.59 + random.uniform(-0.05, 0.05)
+        rows.append({"id": f"r{i:02d}", "latitude": lat, "longitude": lon})
+    for i in range(6):
+        rows.append({"id": f"same{i}", "latitude": 12.98, "longitude": 77.60})
+    for i, offset in enumerate((0.01, -0.01, 0.02, -0.02)):
+        rows.append({"id": f"mirror{i}", "latitude": 12.97, "longitude": 77.59 + offset})
+    random.shuffle(rows)
+    return rows
+
+
+def test_ties_are_ordered_by_id():
+    rows = scattered_rows()
+    selected, distances = nearest(12.97, 77.59, rows, 10.0)
+
+    assert [(d, str(row["id"])) for row, d in zip(selected, distances)] == sorted(
+        (d, str(row["id"])) for row, d in zip(selected, distances)
+    )
+    same = [row["id"] for row in selected if str(row["id"]).startswith("same")]
+    assert same == sorted(same)
+
+
+@pytest.mark.parametrize("page_size", [1, 3, 7])
+def test_cursor_pages_cover_every_row_once(page_size):
+    rows = scattered_rows()
+    everything, _ = nearest(12.97, 77.59, rows, 10.0)
+
+    paged, after = [], None
+    # A cursor that fails to advance would page forever; bound it
+    for _ in range(len(rows) + 1):
+        page, distances = nearest(12.97, 77.59, rows, 10.0, limit=page_size, after=after)
+        if not page:
+            break
+        paged.extend(page)
+        after = (distances[-1], str(page[-1]["id"]))
+
+    assert [row["id"] for row in paged] == [row["id"] for row in everything]
+
+
+def test_cursor_inside_a_tie_resumes_after_its_id():
+    rows = scattered_rows()
+    everything, distances = nearest(12.97, 77.59, rows, 10.0)
+    tied = [i for i, row in enumerate(everything) if str(row["id"]).startswith("same")]
+    cut = tied[2]
+
+    page, _ = nearest(12.97, 77.59, rows, 10.0, limit=3, after=(distances[cut], str(everything[cut]["id"])))
+
+    assert [row["id"] for row in page] == [row["id"] for row in everything[cut + 1:cut + 4]]
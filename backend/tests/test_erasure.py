@@ -0,0 +1,60 @@
+import asyncio
+import time
+
+from erasure import ERASURE_STEPS, ErasureJobs
+
+
+class Rows:
+    """Per-step row counts shared by every worker, like one backing database"""
+
+    def __init__(self, count: int):
+        self.left = {step: count for step in ERASURE_STEPS}
+        self.deleted = 0
+
+    def delete_batch(self, step: str, user_id: str, limit: int) -> int:
+        deleted = min(limit, self.left[step])
+        self.left[step] -= deleted
+        self.deleted += deleted
+        return deleted
+
+
+def test_workers_sharing_a_table_run_each_job_once(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    rows = Rows(5)
+    completed = []
+    workers = [
+        ErasureJobs(delete_batch=rows.delete_batch, on_complete=completed.append, path=path, batch_size=2, pause=0)
+        for _ in range(2)
+    ]
+
+    async def race():
+        job = await workers[0].schedule("erased")
+        await asyncio.gather(*(worker._process(dict(job)) for worker in workers))
+        return await workers[1].get(job["id"])
+
+    assert asyncio.run(race())["status"] == "completed"
+    assert completed == ["erased"]
+    assert rows.deleted == 5 * len(ERASURE_STEPS)
+    for worker in workers:
+        worker.close()
+
+
+def test_a_worker_that_lost_its_lease_stops_writing(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    rows = Rows(5)
+    stale = ErasureJobs(delete_batch=rows.delete_batch, path=path, lease=0)
+    fresh = ErasureJobs(delete_batch=rows.delete_batch, path=path, lease=0)
+    job = asyncio.run(stale.schedule("erased"))
+
+    stale_job = dict(job)
+    assert stale._claim(stale_job)
+    time.sleep(0.01)
+    fresh_job = dict(job)
+    assert fresh._claim(fresh_job)
+
+    stale_job.update(status="failed", error="boom")
+    assert not stale._save(stale_job)
+    assert asyncio.run(fresh.get(job["id"]))["status"] == "running"
+    assert fresh._save(fresh_job)
+    stale.close()
+    fresh.close()
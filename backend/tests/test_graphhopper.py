@@ -0,0 +1,74 @@
+import asyncio
+
+import httpx
+import pytest
+
+from graphhopper import GraphHopperClient, GraphHopperError
+from route_cache import EtaMatrix
+
+
+def answering(*responses: httpx.Response) -> GraphHopperClient:
+    """A client whose calls get the given responses in turn"""
+    remaining = list(responses)
+    return GraphHopperClient(api_key="key", transport=httpx.MockTransport(lambda request: remaining.pop(0)))
+
+
+def test_deadline_cancels_the_in_flight_attempt():
+    cancelled = []
+
+    async def slow(request: httpx.Request) -> httpx.Response:
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(request.url.path.rsplit("/", 1)[-1])
+            raise
+        return httpx.Response(200, json={})
+
+    async def call():
+        client = GraphHopperClient(api_key="key", timeout=0.05, hedge_after=5, transport=httpx.MockTransport(slow))
+        with pytest.raises(GraphHopperError) as raised:
+            await client.request("GET", "/route")
+        await asyncio.sleep(0.01)
+        await client.close()
+        # Checked inside the loop, before asyncio.run cancels leftover tasks itself
+        return raised.value.status_code, list(cancelled)
+
+    assert asyncio.run(call()) == (504, ["route"])
+
+
+@pytest.mark.parametrize("response", [
+    httpx.Response(200, text="<html>Bad gateway</html>"),
+    httpx.Response(200, json=["not", "an", "object"]),
+    httpx.Response(200, json={"paths": []}),
+])
+def test_unusable_route_bodies_raise_graphhopper_errors(response):
+    async def call():
+        client = answering(response)
+        try:
+            await client.route(12.97, 77.59, 12.98, 77.60)
+        finally:
+            await client.close()
+
+    with pytest.raises(GraphHopperError) as raised:
+        asyncio.run(call())
+    assert raised.value.status_code == 502
+
+
+@pytest.mark.parametrize("response", [
+    httpx.Response(200, text="not json"),
+    httpx.Response(200, json={"distances": [[1000.0]]}),
+    httpx.Response(200, json={"distances": [[1000.0]], "times": [[900.0]]}),
+    httpx.Response(200, json={"distances": [[1000.0, "far"]], "times": [[900.0, None]]}),
+])
+def test_malformed_matrix_answers_fall_back_to_estimates(response):
+    async def call():
+        client = answering(response)
+        try:
+            return await EtaMatrix().matrix(client, 12.97, 77.59, [(12.98, 77.60), (12.99, 77.61)])
+        finally:
+            await client.close()
+
+    entries = asyncio.run(call())
+    assert len(entries) == 2
+    assert entries[1]["source"] == "estimate"
+    assert all(entry["eta_seconds"] > 0 for entry in entries)
@@ -0,0 +1,47 @@
+import asyncio
+
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import StreamingResponse
+from starlette.routing import Route
+
+import profiling
+
+
+@pytest.fixture
+def sampled(tmp_path, monkeypatch):
+    """Rate-sample every request under /api/, saving profiles to a temporary directory"""
+    monkeypatch.setattr(profiling, "PROFILE_SAMPLE_RATE", 1.0)
+    monkeypatch.setattr(profiling, "PROFILE_PATHS", ["/api/"])
+    monkeypatch.setattr(profiling.profile_store, "path", str(tmp_path))
+    return profiling.profile_store
+
+
+def stream_app(fail: bool) -> profiling.ProfilingMiddleware:
+    async def events(request):
+        async def body():
+            yield "data: 1\n\n"
+            if fail:
+                raise RuntimeError("stream broke")
+        return StreamingResponse(body(), media_type="text/event-stream")
+    return profiling.ProfilingMiddleware(Starlette(routes=[Route("/api/events", events)]))
+
+
+async def get(app, path: str) -> httpx.Response:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        return await client.get(path)
+
+
+def test_sampled_event_stream_is_discarded(sampled):
+    response = asyncio.run(get(stream_app(fail=False), "/api/events"))
+    assert response.status_code == 200
+    assert "x-profile-id" not in response.headers
+    assert sampled.list() == []
+    assert not profiling.sampler.sessions
+
+
+def test_app_error_propagates_through_discarded_stream(sampled):
+    with pytest.raises(RuntimeError, match="stream broke"):
+        asyncio.run(get(stream_app(fail=True), "/api/events"))
+    assert not profiling.sampler.sessions
@@ -0,0 +1,11 @@
+from request_stream import RequestEventBroker
+
+
+def test_area_versions_from_another_process_never_match():
+    broker, restarted = RequestEventBroker(), RequestEventBroker()
+    cells = broker.grid.cells_in_radius(12.97, 77.59, 2.0)
+    restarted.touch(cells)
+    broker.touch(cells)
+
+    assert broker.area_version(cells, 12.97, 77.59) == broker.area_version(cells, 12.97, 77.59)
+    assert broker.area_version(cells, 12.97, 77.59) != restarted.area_version(cells, 12.97, 77.59)
@@ -0,0 +1,32 @@
+import asyncio
+
+import main
+
+
+def run_topk(monkeypatch, available_at, k=5, radius_km=1.0):
+    """Radii find_nearest_pending searched, and its rows, when k rows only exist past available_at km"""
+    radii = []
+
+    async def find_pending_in_radius(lat, lon, radius, exclude_user_id, since=None, limit=None, after=None):
+        radii.append(radius)
+        count = k if radius >= available_at else 1
+        return [{"id": f"r{i}", "distance_km": 0.0} for i in range(count)]
+
+    monkeypatch.setattr(main, "find_pending_in_radius", find_pending_in_radius)
+    rows = asyncio.run(main.find_nearest_pending(12.97, 77.59, k, radius_km, "u1"))
+    return radii, rows
+
+
+def test_topk_widens_the_radius_until_k_rows_are_found(monkeypatch):
+    radii, rows = run_topk(monkeypatch, available_at=6.0)
+
+    assert radii == [1.0, 2.0, 4.0, 8.0]
+    assert len(rows) == 5
+
+
+def test_topk_widening_stops_at_the_max_radius(monkeypatch):
+    monkeypatch.setattr(main, "TOPK_MAX_RADIUS_KM", 10.0)
+    radii, rows = run_topk(monkeypatch, available_at=1000.0)
+
+    assert radii == [1.0, 2.0, 4.0, 8.0, 10.0]
+    assert len(rows) == 1
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import os
+from typing import Any, Callable, Dict
+
+from blocking_io import run_blocking
+from cache import SingleFlight, TTLCache
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+USER_STATS_CACHE_SIZE = int(os.getenv("USER_STATS_CACHE_SIZE", "50000"))
+# Counters are recounted from the database at least this often
+USER_STATS_TTL_SECONDS = float(os.getenv("USER_STATS_TTL_SECONDS", "3600"))
+USER_STATS_RECONCILE_SECONDS = float(os.getenv("USER_STATS_RECONCILE_SECONDS", "300"))
+USER_STATS_RECONCILE_BATCH = int(os.getenv("USER_STATS_RECONCILE_BATCH", "100"))
+
+# Request statuses that have a counter of their own
+REQUEST_STATUS_FIELDS = {"pending": "active_requests", "completed": "completed_requests"}
+
+
+class UserStats:
+    """Per-user request and transaction counters, updated as rows change state.
+
+    A user's counters are counted from the database on first read and then
+    adjusted on every create and status change, so reading them is O(1).
+    The last known state of each request and transaction is kept to turn a
+    write into a delta; a write whose previous state is unknown drops the
+    user's counters so they are recounted. A background job recounts the
+    cached users in batches to correct any drift.
+    """
+
+    def __init__(
+        self,
+        count: Callable[[str], Dict[str, Any]],
+        maxsize: int = USER_STATS_CACHE_SIZE,
+        ttl: float = USER_STATS_TTL_SECONDS,
+    ):
+        self.count = count
+        self.counters = TTLCache(maxsize=maxsize, ttl=ttl)
+        # request id -> (user_id, status)
+        self._requests = TTLCache(maxsize=maxsize * 10, ttl=ttl)
+        # transaction id -> (from_user, to_user, status, amount)
+        self._transactions = TTLCache(maxsize=maxsize * 10, ttl=ttl)
+        # Users being recounted -> whether they changed meanwhile
+        self._recounting: Dict[str, bool] = {}
+        self.flights = SingleFlight()
+        self.reconciled = 0
+        self.corrected = 0
+
+    def _changed(self, user_id: str) -> None:
+        if user_id in self._recounting:
+            self._recounting[user_id] = True
+
+    def _adjust(self, user_id: str, field: str, delta: float) -> None:
+        self._changed(user_id)
+        counters = self.counters.get(user_id, count=False)
+        if counters is not None:
+            counters[field] += delta
+
+    def _invalidate(self, user_id: str) -> None:
+        self._changed(user_id)
+        self.counters.pop(user_id)
+
+    def request_changed(self, row: Dict[str, Any], created: bool = False) -> None:
+        """Apply a created or updated request row"""
+        user_id, status = row.get("user_id"), row.get("status")
+        if user_id is None:
+            return
+        request_id = str(row.get("id"))
+        previous = self._requests.get(request_id, count=False)
+        self._requests.set(request_id, (user_id, status))
+        if previous is None and not created:
+            self._invalidate(user_id)
+            return
+
+        previous_status = previous[1] if previous else None
+        if previous_status == status:
+            return
+        if previous_status in REQUEST_STATUS_FIELDS:
+            self._adjust(user_id, REQUEST_STATUS_FIELDS[previous_status], -1)
+        if status in REQUEST_STATUS_FIELDS:
+            self._adjust(user_id, REQUEST_STATUS_FIELDS[status], 1)
+
+    def transaction_changed(self, row: Dict[str, Any], created: bool = False) -> None:
+        """Apply a created or updated transaction row"""
+        users = {user for user in (row.get("from_user"), row.get("to_user")) if user is not None}
+        status, amount = row.get("status"), float(row.get("amount") or 0)
+        transaction_id = str(row.get("id"))
+        previous = self._transactions.get(transaction_id, count=False)
+        self._transactions.set(transaction_id, (row.get("from_user"), row.get("to_user"), status, amount))
+        if previous is None and not created:
+            for user_id in users:
+                self._invalidate(user_id)
+            return
+
+        for user_id in users:
+            if created:
+                self._adjust(user_id, "total_transactions", 1)
+            if previous and previous[2] == "completed":
+                self._adjust(user_id, "total_amount", -previous[3])
+            if status == "completed":
+                self._adjust(user_id, "total_amount", amount)
+
+    def forget(self, user_id: str) -> None:
+        self._invalidate(user_id)
+
+    async def reconcile(self, user_id: str) -> Dict[str, Any]:
+        """Recount a user's counters from the database and cache them"""
+        return await self.flights.run(user_id, lambda: self._reconcile(user_id))
+
+    async def _reconcile(self, user_id: str) -> Dict[str, Any]:
+        self._recounting[user_id] = False
+        try:
+            counters = await run_blocking(self.count, user_id)
+            cached = self.counters.get(user_id, count=False)
+            # A change that landed mid-count may be missing, so don't cache it
+            if not self._recounting[user_id]:
+                if cached is not None and cached != counters:
+                    self.corrected += 1
+                    logger.info(f"Corrected stats for user {user_id}: {cached} -> {counters}")
+                self.counters.set(user_id, counters)
+            self.reconciled += 1
+            return counters
+        finally:
+            del self._recounting[user_id]
+
+    async def get(self, user_id: str) -> Dict[str, Any]:
+        """A user's stats, counted from the database only on a cold read"""
+        counters = self.counters.get(user_id)
+        if counters is None:
+            counters = await self.reconcile(user_id)
+        total = counters["total_transactions"]
+        return {
+            **counters,
+            "success_rate": counters["completed_requests"] / total * 100 if total else 0
+        }
+
+    async def run(self, interval: float = USER_STATS_RECONCILE_SECONDS, batch: int = USER_STATS_RECONCILE_BATCH) -> None:
+        """Recount the least recently touched cached users until cancelled"""
+        while True:
+            await asyncio.sleep(interval)
+            for user_id in self.counters.keys()[:batch]:
+                try:
+                    await self.reconcile(user_id)
+                except Exception as e:
+                    logger.error(f"Error reconciling stats for user {user_id}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.counters.stats(), "reconciled": self.reconciled, "corrected": self.corrected}